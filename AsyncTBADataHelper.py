@@ -0,0 +1,206 @@
+import asyncio
+from .TBADataHelper import TBADataHelper
+from .async_tba import async_TBA, run_in_thread
+from .instrumentation import instrumented, timer
+
+
+class AsyncTBADataHelper:
+    """
+    asyncio version of TBADataHelper's single team, single event and season methods. Requests share one pooled aiohttp
+    session and are scheduled by a token bucket so they stay under TBA's rate limit, while requests for several events
+    are sent concurrently.
+
+    Every method is a coroutine split in two parts:
+    - The data is fetched through async_TBA in the event loop, without blocking it.
+    - The calculations are the same ones TBADataHelper performs, run on the fetched data in the event loop's thread pool
+    so they don't block other coroutines. Where the calculation is a TBADataHelper method, it's called on self.helper
+    with the fetched matches (or event CCs), so self.helper never sends a request of its own.
+
+    Only get_team_field_statistics, get_team_OPR_statistic, get_event_field_statistics, get_event_OPRs,
+    get_event_component_OPRs, get_event_contributions and get_season_OPRs have async versions, and
+    get_team_field_statistics has no stream option since the team's matches are fetched in one request anyway. Use
+    TBADataHelper (for example through run_in_thread from async_tba.py) for the other methods.
+
+    Use it as an async context manager, or await close() when done, so the session is closed:
+    async with AsyncTBADataHelper('###MY_AUTHKEY###', 2020) as fetcher:
+        event_OPRs = await fetcher.get_event_OPRs('2020orore')
+
+    Constructor arguments:
+    year: int = The year to get data from
+    max_concurrency: int = the number of events requested at the same time by fan-out methods. default = 8
+    rate: float = the number of requests per second allowed on average. default = 10
+    burst: int = the number of requests that can be sent at once before rate applies. default = 20
+    cache: response_cache = serve and revalidate responses through a response_cache (see cache.py). default=None
+    """
+
+    def __init__(self, authkey, year, max_concurrency=8, rate=10, burst=20, cache=None, read_url=None):
+        self.authkey = authkey
+        self.year = year
+        self.max_concurrency = max_concurrency
+
+        # TBA data handler
+        self.tba = async_TBA(authkey, rate, burst, max_connections=max_concurrency, cache=cache, read_url=read_url)
+        # Performs the calculations on the fetched matches. Its own (blocking) TBA data handler is never used, since the
+        # data is always passed in
+        self.helper = TBADataHelper(authkey, year)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await self.tba.close()
+
+    # Fetches the matches of every event with at most max_concurrency requests in flight.
+    # Returns a list of the event's matches or the exception raised while fetching them, in the same order as event_keys
+    async def fetch_event_matches(self, event_keys):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(event_key):
+            async with semaphore:
+                return await self.tba.event_matches(event_key)
+
+        return await asyncio.gather(*[fetch(event_key) for event_key in event_keys], return_exceptions=True)
+
+    # Fetches and solves every event. Returns the same (event_CCs, errors) tuple as batch.season_OPRs()
+    async def calculate_event_CCs(self, event_keys, field, exclude_playoffs):
+        from .batch import create_event_system, solve_event_system, create_event_CCs
+
+        metrics = field if field == 'all' else [field] if isinstance(field, str) else list(field)
+
+        event_CCs = {}
+        errors = {}
+        for event_key, matches in zip(event_keys, await self.fetch_event_matches(event_keys)):
+            if isinstance(matches, Exception):
+                errors[event_key] = repr(matches)
+                continue
+            try:
+                system = await run_in_thread(create_event_system, matches, metrics, exclude_playoffs)
+                # Events without any played matches are left out of the results
+                if system is not None:
+                    solutions = await run_in_thread(solve_event_system, *system[:3])
+                    event_CCs[event_key] = create_event_CCs(system[0], solutions, field, system[3])
+            except Exception as error:
+                errors[event_key] = repr(error)
+        return event_CCs, errors
+
+    @instrumented
+    async def get_team_field_statistics(self, team_key, field_name, calculations=['mean'],
+                                        field_position_based=False, categorical_value=None, exclude_playoffs=True,
+                                        event_key=None):
+        """
+        Returns a dictionary of calculated statistics mean/med/min/max/stdev/count for a given field (ex. totalPoints)
+
+        See TBADataHelper.get_team_field_statistics() for a description of the parameters
+        """
+        from .functions import get_field_statistic
+        from .match_store import event_match_store
+
+        if team_key is None:
+            print("A TBA team key is needed to perform this calculation")
+            return
+
+        matches = await self.tba.team_matches(team_key, event=event_key, year=self.year)
+        match_store = event_match_store(self.authkey, event_key, matches)
+
+        def calculate():
+            with timer('aggregate'):
+                return get_field_statistic(self.authkey, team_key, self.year, field_name, calculations,
+                                           field_position_based, categorical_value, exclude_playoffs, event_key,
+                                           match_store=match_store)
+        return await run_in_thread(calculate)
+
+    @instrumented
+    async def get_team_OPR_statistic(self, team_key, field='totalPoints', calculations=['mean'],
+                                     exclude_playoffs=True):
+        """
+        Returns a dictionary of the mean/med/min/max/stdev/count of a team's OPR at every competition they've attended
+
+        See TBADataHelper.get_team_OPR_statistic() for a description of the parameters
+        """
+        if team_key is None:
+            print("A TBA team key is needed to perform this calculation")
+            return
+
+        event_keys = await self.tba.team_events(team_key, year=self.year, keys=True)
+        event_CCs, errors = await self.calculate_event_CCs(event_keys, field, exclude_playoffs)
+        for event, error in errors.items():
+            print("Error in calculating CCs for event_key:", event, error)
+
+        return await run_in_thread(self.helper.get_team_OPR_statistic, team_key, field, calculations, exclude_playoffs,
+                                   event_CCs=event_CCs)
+
+    @instrumented
+    async def get_event_field_statistics(self, event_key, field_name, calculations=['mean'],
+                                         field_position_based=False, categorical_value=None, exclude_playoffs=True):
+        """
+        Returns a dictionary of calculated statistics (mean/med/min/max/stdev/count) for a given field (ex. totalPoints)
+        for all teams at an event
+
+        See TBADataHelper.get_event_field_statistics() for a description of the parameters
+        """
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        matches = await self.tba.event_matches(event_key)
+        return await run_in_thread(self.helper.get_event_field_statistics, event_key, field_name, calculations,
+                                   field_position_based, categorical_value, exclude_playoffs, matches=matches)
+
+    @instrumented
+    async def get_event_OPRs(self, event_key, field='totalPoints', exclude_playoffs=True):
+        """
+        Returns a dictionary containing the OPR of all teams at an event.
+
+        See TBADataHelper.get_event_OPRs() for a description of the parameters
+        """
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        matches = await self.tba.event_matches(event_key)
+        return await run_in_thread(self.helper.get_event_OPRs, event_key, field, exclude_playoffs, matches=matches)
+
+    @instrumented
+    async def get_event_component_OPRs(self, event_key, fields='all', exclude_playoffs=True):
+        """
+        Returns a dictionary containing the contribution of all teams at an event to several score_breakdown fields.
+
+        See TBADataHelper.get_event_component_OPRs() for a description of the parameters
+        """
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        matches = await self.tba.event_matches(event_key)
+        return await run_in_thread(self.helper.get_event_component_OPRs, event_key, fields, exclude_playoffs,
+                                   matches=matches)
+
+    @instrumented
+    async def get_event_contributions(self, event_key, models=['opr', 'dpr', 'ccwm'], field='totalPoints',
+                                      exclude_playoffs=True, regularization=1.0, noise_ratio=None):
+        """
+        Returns a dictionary containing several contribution models for all teams at an event.
+
+        See TBADataHelper.get_event_contributions() for a description of the parameters
+        """
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        matches = await self.tba.event_matches(event_key)
+        return await run_in_thread(self.helper.get_event_contributions, event_key, models, field, exclude_playoffs,
+                                   regularization, noise_ratio, matches=matches)
+
+    @instrumented
+    async def get_season_OPRs(self, event_keys=None, field='totalPoints', exclude_playoffs=True):
+        """
+        Returns the OPRs of every team at every event in the year, requested concurrently
+
+        See TBADataHelper.get_season_OPRs() for a description of the parameters
+        """
+        if event_keys is None:
+            event_keys = await self.tba.events(self.year, keys=True)
+        return await self.calculate_event_CCs(event_keys, field, exclude_playoffs)
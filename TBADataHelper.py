@@ -1,7 +1,8 @@
-from .functions import *
-from .opr import *
-from tbapy import TBA
-from statistics import stdev
+from .utils import get_tba
+from .instrumentation import instrumented, timer
+
+# The calculations are imported inside the methods that use them, so importing TBADataHelper doesn't import NumPy or
+# any calculation that isn't used
 
 
 class TBADataHelper:
@@ -17,10 +18,14 @@ class TBADataHelper:
         self.year = year
 
         # TBA data handler
-        self.tba = TBA(authkey)
+        self.tba = get_tba(authkey)
+        # The last world OPRs and event offsets, used as the starting point of the next get_world_OPRs()
+        self.world_OPRs = None
+        self.world_event_offsets = None
 
+    @instrumented
     def get_team_field_statistics(self, team_key, field_name, calculations=['mean'], field_position_based=False,
-                             categorical_value=None, exclude_playoffs=True, event_key=None):
+                             categorical_value=None, exclude_playoffs=True, event_key=None, stream=False):
         """
         Returns a dictionary of calculated statistics mean/med/min/max/stdev/count for a given field (ex. totalPoints)
 
@@ -38,22 +43,32 @@ class TBADataHelper:
         categorical_value: str = the categorical value to count. default=None
         exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
         event_key: str: = specify an event_key if you only want to perform calculations on matches played at a certain event. default=None
+        stream: boolean = whether to calculate the statistics as the team's matches are read with running totals, so
+        they're never all held in memory. med is estimated when streaming. default=False
 
         Returns:
         calculated_statistics: dict = Dictionary of keys corresponding to the calculation name and values corresponding
         to the calculated value ex.) {mean: 77, max: 154, ...}
         """
+        from .functions import get_field_statistic
+        from .streaming import stream_field_statistic
 
         if team_key is None:
             print("A TBA team key is needed to perform this calculation")
             return
 
+        if stream:
+            return stream_field_statistic(self.authkey, team_key, self.year, field_name, calculations,
+                                          field_position_based, categorical_value, exclude_playoffs, event_key)
+
         return get_field_statistic(self.authkey, team_key, self.year, field_name, calculations,
                                     field_position_based,
                                     categorical_value,
                                     exclude_playoffs, event_key)
 
-    def get_team_OPR_statistic(self, team_key, field='totalPoints', calculations=['mean'], exclude_playoffs=True):
+    @instrumented
+    def get_team_OPR_statistic(self, team_key, field='totalPoints', calculations=['mean'], exclude_playoffs=True,
+                               event_CCs=None):
         """
         Returns a dictionary of the mean/med/min/max/stdev/count of a team's OPR at every competition they've attended
 
@@ -62,36 +77,40 @@ class TBADataHelper:
         field: str = the TBA field to calculate contribution for. default='totalPoints'
         calculations: list<str> = list of calculations to perform on a team's field values. mean, med, min, max, stdev, count. default=['mean']
         exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        event_CCs: dict = event CCs already calculated by get_season_OPRs() for the same field. If given, the team's
+        OPRs are read from it instead of TBA. default=None
 
         Returns:
 
         calculated_statistics: dict = Dictionary of keys corresponding to the calculation name and
         values corresponding to their value ex.) {mean: 56, max: 56, ...}
         """
+        from statistics import mean, median, stdev
+        from .batch import season_OPRs
+
         if team_key is None:
             print("A TBA team key is needed to perform this calculation")
             return
 
+        if event_CCs is None:
+            # Events without any played matches are left out of the results
+            event_CCs, errors = season_OPRs(self.authkey,
+                                            event_keys=self.tba.team_events(team=team_key, year=self.year, keys=True),
+                                            metric=field, exclude_playoffs=exclude_playoffs, solve_workers=0)
+            # HOTFIX: Events that aren't stored in TBA with standardized conventions (such as offseason events)
+            # will break event OPR calculations. Such events will be skipped over
+            for event, error in errors.items():
+                print("Error in calculating CCs for event_key:", event, error)
+
         # List of tuples of format (event_key, event_CC for team)
         all_event_CCs = []
-        for event in self.tba.team_events(team=team_key, year=self.year, keys=True):
-            # Only calculate event CCs for events that have had matches
-            if check_matches_exist(self.authkey, 2019, event_key=event, exclude_playoffs=exclude_playoffs):
-                # HOTFIX: Events that aren't stored in TBA with standardized conventions (such as offseason events)
-                # will break event OPR calculations. Such events will be skipped over
-                try:
-                    event_CCs = event_OPR(self.authkey, event, field, exclude_playoffs)
-                except:
-                    print("Error in calculating CCs for event_key:", event)
-                    continue
-                # Skip over any teams that didn't play any matches in their event
-                try:
-                    all_event_CCs.append((event, event_CCs.calculate_contribution()[team_key]))
-                except KeyError:
-                    print("Team: ", team_key, "didn't play any matches")
-                    continue
-            else:
-                continue
+        for event, CCs in event_CCs.items():
+            # Skip over any events the team didn't play any matches in
+            if team_key in CCs:
+                all_event_CCs.append((event, CCs[team_key]))
+
+        if len(all_event_CCs) == 0:
+            print("Team: ", team_key, "didn't play any matches")
 
         # Associates a calculation keyword to its appropriate function
         calculation_map = {'mean': mean, 'med': median, 'max': max, 'min': min, 'stdev': stdev, 'count': len}
@@ -109,9 +128,10 @@ class TBADataHelper:
 
         return calculated_statistics
 
+    @instrumented
     def get_event_field_statistics(self, event_key, field_name, calculations=['mean'], field_position_based=False,
                                     categorical_value=None,
-                                    exclude_playoffs=True):
+                                    exclude_playoffs=True, matches=None):
         """
         Returns a dictionary of calculated statistics (mean/med/min/max/stdev/count) for a given field (ex. totalPoints)
         for all teams at an event
@@ -125,6 +145,7 @@ class TBADataHelper:
         field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
         categorical_value: str = the categorical value to count. default=None
         exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
 
         Returns:
         calculated_event_statistics: dict = Returns (possibly nested) dictionary holding the calculated statistic(s)
@@ -132,6 +153,8 @@ class TBADataHelper:
         If field is position based, team_keys are keys. ex.) {'frc2521': 0.76, ...}
         If not, Outer key is the calculation name and inner keys are team keys ex.) {mean: {'frc2521': 100, ...}}
         """
+        from .functions import get_field_statistic
+        from .match_store import event_match_store
 
         if event_key is None:
             print("A TBA event key is needed to perform this calculation")
@@ -142,18 +165,20 @@ class TBADataHelper:
                 f"A a list of calculations {calculations} was given but only the proportion of times that the"
                 f" categorical_value was recorded in each of the teams' matches will be returned")
 
-        tba = TBA(self.authkey)
-
-        event_team_keys = [team.key for team in tba.event_teams(event_key, simple=True)]
+        # Load every match at the event once and serve each team's statistics from it
+        match_store = event_match_store(self.authkey, event_key, matches)
 
         # Creates (maybe nested) dictionary holding the calculated statistic(s) for a given field for each team at the event
-        all_teams_statistics = dict.fromkeys(calculations, {}) if not field_position_based else dict()
-        for team_key in event_team_keys:
-            calculated_statistics = get_field_statistic(self.authkey, team_key, self.year, field_name,
-                                                         calculations,
-                                                         field_position_based,
-                                                         categorical_value,
-                                                         exclude_playoffs, event_key=event_key)
+        all_teams_statistics = {calculation: {} for calculation in calculations} if not field_position_based else dict()
+        for team_key in match_store.get_team_keys():
+            # The matches are already loaded, so all of the call's time is spent calculating
+            with timer('aggregate'):
+                calculated_statistics = get_field_statistic(self.authkey, team_key, self.year, field_name,
+                                                             calculations,
+                                                             field_position_based,
+                                                             categorical_value,
+                                                             exclude_playoffs, event_key=event_key,
+                                                             match_store=match_store)
             if field_position_based:
                 all_teams_statistics[team_key] = calculated_statistics
             else:
@@ -162,7 +187,8 @@ class TBADataHelper:
 
         return all_teams_statistics
 
-    def get_event_OPRs(self, event_key, field='totalPoints', exclude_playoffs=True):
+    @instrumented
+    def get_event_OPRs(self, event_key, field='totalPoints', exclude_playoffs=True, matches=None, opr=None):
         """
         Returns a dictionary containing the OPR of all teams at an event.
 
@@ -171,15 +197,331 @@ class TBADataHelper:
         field: str = the TBA/FIRSTApi field to calculate contribution for. default='totalPoints'
         Changing this will result in something other than OPRs being returned. Don't touch unless you know what you're doing
         exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+        opr: event_OPR = the event's contributions if they've already been set up for the same field(s), ex.) kept by
+        server.py. Its factorizations are reused. default=None
 
         Returns:
 
         calculated_contributions: dictionary = Keys are TBA team_keys with values being the team's OPR at the event
         ex.) {frc2521: 65, frc254: 148, ...}
         """
+        from .opr import event_OPR
+
         if event_key is None:
             print("A TBA event key is needed to perform this calculation")
             return
 
-        event_CCs = event_OPR(self.authkey, event_key, field, exclude_playoffs)
+        event_CCs = opr if opr is not None else event_OPR(self.authkey, event_key, field, exclude_playoffs, matches)
         return event_CCs.calculate_contribution()
+
+    @instrumented
+    def get_event_component_OPRs(self, event_key, fields='all', exclude_playoffs=True, matches=None, opr=None):
+        """
+        Returns a dictionary containing the contribution of all teams at an event to several score_breakdown fields.
+        The event's matches are only fetched and its alliance matrix only factored once for all of the fields.
+
+        Parameters:
+        event_key: str: = the event to get team contributions from
+        fields: list<str> = the TBA/FIRSTApi fields to calculate contribution for, ex.) ['autoPoints', 'teleopPoints'].
+        'all' calculates contributions to every numeric field in the score breakdown. default='all'
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+        opr: event_OPR = the event's contributions if they've already been set up for the same field(s), ex.) kept by
+        server.py. Its factorizations are reused. default=None
+
+        Returns:
+
+        calculated_contributions: dictionary = Keys are TBA team_keys with values being a dictionary of the team's
+        contribution to each field ex.) {frc2521: {autoPoints: 12, teleopPoints: 40, ...}, ...}
+        """
+        from .opr import event_OPR
+
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        event_CCs = opr if opr is not None else event_OPR(self.authkey, event_key, fields, exclude_playoffs, matches)
+        return event_CCs.calculate_contributions()
+
+    @instrumented
+    def get_event_contributions(self, event_key, models=['opr', 'dpr', 'ccwm'], field='totalPoints',
+                                exclude_playoffs=True, regularization=1.0, noise_ratio=None, matches=None,
+                                opr=None):
+        """
+        Returns a dictionary containing several contribution models for all teams at an event. The event's matches are
+        only fetched and its normal equations only decomposed once for all of the models.
+
+        Parameters:
+        event_key: str: = the event to get team contributions from
+        models: list<str> = the models to calculate. default=['opr', 'dpr', 'ccwm']
+        'opr': contribution to the alliance's score
+        'dpr': contribution to the opposing alliance's score
+        'ccwm': contribution to the winning margin (opr - dpr)
+        'ridge': opr shrunk towards 0, which keeps it stable early in an event
+        'mmse': opr shrunk towards the average contribution by how noisy the scores are, also stable early in an event
+        field: str = the TBA/FIRSTApi field to calculate contribution for. A list of fields calculates all of them.
+        default='totalPoints'
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        regularization: float = how strongly 'ridge' contributions are shrunk towards 0. default = 1.0
+        noise_ratio: float = how strongly 'mmse' contributions are shrunk. default=None (estimate it from the matches)
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+        opr: event_OPR = the event's contributions if they've already been set up for the same field(s), ex.) kept by
+        server.py. Its factorizations are reused. default=None
+
+        Returns:
+
+        calculated_models: dictionary = Keys are models with values being dictionaries of each team's contribution
+        ex.) {opr: {frc2521: 65, ...}, dpr: {frc2521: 40, ...}, ccwm: {frc2521: 25, ...}}. If field is a list, the
+        team's values are dictionaries of their contribution to each field
+        """
+        from .opr import event_OPR
+
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        event_CCs = opr if opr is not None else event_OPR(self.authkey, event_key, field, exclude_playoffs, matches)
+        calculated_models = event_CCs.calculate_models(models, regularization, noise_ratio)
+        if isinstance(field, str):
+            return {model: {team: contributions[field] for (team, contributions) in team_contributions.items()}
+                    for (model, team_contributions) in calculated_models.items()}
+        return calculated_models
+
+    @instrumented
+    def get_season_OPRs(self, event_keys=None, field='totalPoints', exclude_playoffs=True, fetch_workers=8,
+                        solve_workers=None):
+        """
+        Returns the OPRs of every team at every event in the year, calculated concurrently
+
+        Parameters:
+        event_keys: list<str> = only calculate OPRs for these events instead of every event in the year. default=None
+        field: str = the TBA field to calculate contribution for. A list of fields calculates all of them. default='totalPoints'
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        fetch_workers: int = the number of events fetched from TBA at the same time. default = 8
+        solve_workers: int = the number of processes solving events. None uses one per CPU, 0 solves them in the
+        fetching threads. The processes are spawned, so scripts using them need their code under
+        if __name__ == '__main__'. default = None
+
+        Returns:
+
+        event_CCs: dictionary = Keys are event keys with values being dictionaries of each team's OPR at the event
+        ex.) {'2020orore': {frc2521: 65, ...}, ...}. Can be passed to get_team_OPR_statistic()
+        errors: dictionary = Keys are the event keys that couldn't be calculated with values being the error message
+        """
+        from .batch import season_OPRs
+
+        return season_OPRs(self.authkey, self.year, event_keys, field, exclude_playoffs, fetch_workers, solve_workers)
+
+    @instrumented
+    def get_world_OPRs(self, field='totalPoints', exclude_playoffs=True, event_offsets=False, half_life=None,
+                       regularization=1e-3, warm_start=True, match_table=None):
+        """
+        Returns one OPR per team for the whole year, solving every match of every event together instead of averaging
+        OPRs solved event by event. Each solve starts from the previous one, so recalculating after new matches are
+        played only takes a few iterations.
+
+        Parameters:
+        field: str = the TBA field to calculate contribution for. default='totalPoints'
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        event_offsets: boolean = whether to solve for a score offset per event so teams aren't rated by how high
+        scoring their events were. default=False
+        half_life: float = the number of days it takes for a match's weight to halve. default=None (every match counts
+        equally)
+        regularization: float = how strongly OPRs are shrunk towards 0. default=1e-3
+        warm_start: boolean = whether to start from the OPRs of the last call. default=True
+        match_table: MatchTable = matches that have already been loaded. default=None (fetch them from TBA)
+
+        Returns:
+
+        world_OPRs: dictionary = Keys are team keys with values being the team's OPR over the year
+        ex.) {frc2521: 65, frc254: 148, ...}. The event offsets are stored in world_event_offsets
+        """
+        from .match_table import load_match_table
+        from .world_opr import world_OPR
+
+        if match_table is None:
+            match_table = load_match_table(self.authkey, self.year)
+
+        if field not in match_table.numeric_fields:
+            print("Make sure your field is a numeric field under scoring_breakdown")
+            return
+
+        solver = world_OPR(match_table, field, exclude_playoffs, event_offsets, half_life, regularization)
+        if warm_start:
+            self.world_OPRs = solver.calculate_contribution(self.world_OPRs, self.world_event_offsets)
+        else:
+            self.world_OPRs = solver.calculate_contribution()
+        self.world_event_offsets = solver.get_event_offsets()
+        return self.world_OPRs
+
+    @instrumented
+    def get_live_event_OPR(self, event_key, field='totalPoints', exclude_playoffs=True):
+        """
+        Returns a live_event_OPR loaded with every match played at an event so far. Call its refresh() method as more
+        matches are played to update the OPRs without recalculating them from scratch.
+
+        Parameters:
+        event_key: str: = the event to get team OPRs from
+        field: str = the TBA/FIRSTApi field to calculate contribution for. default='totalPoints'
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+
+        Returns:
+
+        live_OPR: live_event_OPR = call calculate_contribution() on it to get a dictionary of each team's OPR
+        ex.) {frc2521: 65, frc254: 148, ...}
+        """
+        from .live_opr import live_event_OPR
+
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        return live_event_OPR(self.authkey, event_key, field, exclude_playoffs)
+
+    @instrumented
+    def get_event_predictions(self, event_key, field='totalPoints', matches=None, opr=None):
+        """
+        Returns the expected score of each alliance and the probability blue wins for every qualification match at an
+        event, predicted from the OPRs of the matches played so far
+
+        Parameters:
+        event_key: str: = the event to predict matches at
+        field: str = the TBA/FIRSTApi field to predict. default='totalPoints'
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+        opr: event_OPR = the event's contributions if they've already been set up for the same field(s), ex.) kept by
+        server.py. Its factorizations are reused. default=None
+
+        Returns:
+
+        predictions: dictionary = Keys are match keys with values being {blue, red, blue_win_probability}
+        ex.) {'2020orore_qm1': {blue: 84.2, red: 77.9, blue_win_probability: 0.6}, ...}
+        """
+        from .simulation import event_simulation
+
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        return event_simulation(self.authkey, event_key, field, matches, opr).predict_matches()
+
+    @instrumented
+    def get_event_ranking_forecast(self, event_key, simulations=10000, seed=None, workers=0, matches=None,
+                                   opr=None):
+        """
+        Returns how likely every team is to finish at each rank at an event, found by replaying the event's unplayed
+        qualification matches many times from the OPRs of the matches played so far. Call it again after every match
+        to refresh the forecast.
+
+        Parameters:
+        event_key: str: = the event to forecast the rankings of
+        simulations: int = the number of times the rest of the event is replayed. default=10000
+        seed: int = seeds the random numbers so the forecast can be repeated exactly. default=None
+        workers: int = the number of processes the replays are split over. None uses one per CPU, 0 runs them in this
+        process. The processes are spawned, so scripts using them need their code under if __name__ == '__main__'.
+        default=0
+        matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+        opr: event_OPR = the event's contributions if they've already been set up for the same field(s), ex.) kept by
+        server.py. Its factorizations are reused. default=None
+
+        Returns:
+
+        rankings: dictionary = Keys are team keys with values being {mean_rank, mean_ranking_points,
+        rank_probabilities}, where rank_probabilities[i] is the probability of finishing ranked i + 1
+        ex.) {frc2521: {mean_rank: 3.2, mean_ranking_points: 18.5, rank_probabilities: [0.31, 0.2, ...]}, ...}
+        """
+        from .simulation import event_simulation
+
+        if event_key is None:
+            print("A TBA event key is needed to perform this calculation")
+            return
+
+        return event_simulation(self.authkey, event_key, matches=matches, opr=opr).simulate_rankings(simulations, seed,
+                                                                                                   workers)
+
+    @instrumented
+    def get_field_trends(self, field_name, calculations=['mean'], years=None, field_position_based=False,
+                         categorical_value=None, exclude_playoffs=True, team_keys=None):
+        """
+        Returns statistics for a given field for every team in every year. Each season is streamed one event at a
+        time, so only one event's matches and one running total per team are ever held in memory.
+
+        Parameters:
+        field_name: str = the TBA field under scoring_breakdown to get calculations for (ex. totalPoints)
+        calculations: list<str> = list of calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+        med is estimated from a few markers instead of every value
+        years: list<int> = the years to calculate statistics for. default=None (only the fetcher's year)
+        field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
+        categorical_value: str = the categorical value to count. default=None
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        team_keys: list<str> = only calculate statistics for these teams. default=None (every team)
+
+        Returns:
+        trends: dict = Keys are years with values in the same layout as get_event_field_statistics()
+        ex.) {2019: {mean: {frc2521: 60, ...}}, 2020: {mean: {frc2521: 77, ...}}}
+        """
+        from .streaming import stream_field_trends
+
+        years = years if years is not None else [self.year]
+        return dict(stream_field_trends(self.authkey, years, field_name, calculations, field_position_based,
+                                        categorical_value, exclude_playoffs, team_keys))
+
+    @instrumented
+    def get_bulk_field_statistics(self, team_keys, years=None, fields=['totalPoints'], calculations=['mean'],
+                                  exclude_playoffs=True, fetch_workers=8):
+        """
+        Returns statistics for many fields for many teams over many years as a list of rows. Each year only requests the
+        events the teams attended (or every event of the year when there are many teams), and identical requests are
+        only sent once.
+
+        Parameters:
+        team_keys: list<str> = the teams to calculate statistics for. None calculates them for every team
+        years: list<int> = the years to calculate statistics for. default=None (only the fetcher's year)
+        fields: list = the TBA fields under scoring_breakdown to get calculations for. Position based fields are given
+        as a (field_name, categorical_value) tuple ex.) ['totalPoints', ('endgameRobot', 'Hang')]. default=['totalPoints']
+        calculations: list<str> = list of calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        fetch_workers: int = the number of events fetched from TBA at the same time. default = 8
+
+        Returns:
+        rows: list<dict> = one row per team, year, field and calculation
+        ex.) [{team_key: frc2521, year: 2020, field: totalPoints, calculation: mean, value: 77}, ...]
+        Position based fields have the calculation 'proportion'
+        """
+        from .bulk import bulk_field_statistics
+
+        years = years if years is not None else [self.year]
+        return bulk_field_statistics(self.authkey, team_keys, years, fields, calculations, exclude_playoffs,
+                                     fetch_workers)
+
+    @instrumented
+    def get_field_statistics_table(self, field_name, calculations=['mean'], field_position_based=False,
+                                   categorical_value=None, exclude_playoffs=True, event_key=None, match_table=None):
+        """
+        Returns a dictionary of calculated statistics (mean/med/min/max/stdev/count) for a given field (ex. totalPoints)
+        for every team at an event or, if no event is given, for every team in the year. All of the teams are
+        calculated at once with NumPy.
+
+        Parameters:
+        field_name: str = the TBA field under scoring_breakdown to get calculations for (ex. totalPoints)
+        calculations: list<str> = list of calculations to perform on a team's field values. mean, med, min, max, stdev, count. default=['mean']
+        field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
+        categorical_value: str = the categorical value to count. default=None
+        exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+        event_key: str: = only perform calculations on matches played at this event. default=None (every event in the year)
+        match_table: MatchTable = matches that have already been loaded. default=None (fetch them from TBA)
+
+        Returns:
+        calculated_statistics: dict = Returns (possibly nested) dictionary holding the calculated statistic(s)
+        for a given field for each team.
+        If field is position based, team_keys are keys. ex.) {'frc2521': 0.76, ...}
+        If not, Outer key is the calculation name and inner keys are team keys ex.) {mean: {'frc2521': 100, ...}}
+        """
+        from .aggregate import team_field_statistics
+        from .match_table import load_match_table
+
+        if match_table is None:
+            match_table = load_match_table(self.authkey, self.year, [event_key] if event_key is not None else None)
+
+        return team_field_statistics(match_table, field_name, calculations, field_position_based, categorical_value,
+                                     exclude_playoffs, event_key)
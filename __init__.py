@@ -0,0 +1,39 @@
+"""
+A simple package used to perform aggregate and OPR calculations on FRC match data collected in 2016 and onwards.
+
+Importing the package doesn't import any of its modules. The names below are loaded from their module the first time
+they're used (PEP 562), so NumPy, tbapy and aiohttp are only imported by the calculations that need them.
+
+TBADataHelper and AsyncTBADataHelper share their names with their modules, so they're imported from them directly:
+from TBADataHelper.TBADataHelper import TBADataHelper
+"""
+
+import importlib
+
+# Keys are the names the package exports. Values are the modules they're defined in
+LAZY_NAMES = {
+    'get_tba': 'utils', 'set_tba_factory': 'utils',
+    'install_cache': 'cache', 'uninstall_cache': 'cache', 'response_cache': 'cache',
+    'install_snapshot': 'snapshot', 'dump_season': 'snapshot', 'save_snapshot': 'snapshot',
+    'load_snapshot': 'snapshot',
+    'install_fake_tba': 'fake_tba', 'generate_season': 'fake_tba', 'load_fixtures': 'fake_tba',
+    'collect_stats': 'instrumentation', 'add_hook': 'instrumentation', 'remove_hook': 'instrumentation',
+    'MatchTable': 'match_table', 'load_match_table': 'match_table',
+    'get_field_statistic': 'functions', 'event_OPR': 'opr', 'live_event_OPR': 'live_opr', 'season_OPRs': 'batch',
+    'world_OPR': 'world_opr', 'event_simulation': 'simulation', 'create_server': 'server',
+}
+
+__all__ = list(LAZY_NAMES)
+
+
+def __getattr__(name):
+    if name not in LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + LAZY_NAMES[name], __name__), name)
+    # Later lookups find it without going through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,114 @@
+import numpy as np
+from .instrumentation import timer
+
+"""
+Calculates field statistics for every team in a MatchTable at once.
+
+Every (match, alliance, station) a team played in becomes one value tagged with the team's id. The values are sorted
+by team id once and every calculation is a grouped NumPy reduction over the sorted values, instead of a Python
+statistics call per team. Position based fields (ex. endgameRobot1/2/3) read each team's own station column and are
+counted with bincount.
+
+Parameters:
+--------------------------------------------------------------
+table: MatchTable = the matches to calculate statistics from
+field_name: string = the TBA field under scoring_breakdown to get calculations for (ex. totalPoints)
+calculations: list<string> = calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
+categorical_value: string = the categorical value to count. default=None
+exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+event_key: string = if specified, only include matches played at the given event. default=None
+
+Returns:
+calculated_statistics: dictionary = If the field is position based, keys are team keys and values are the proportion
+of matches categorical_value was recorded in ex.) {'frc2521': 0.76, ...}
+If not, the outer key is the calculation name and inner keys are team keys ex.) {mean: {'frc2521': 100, ...}}
+Teams with only one value get a stdev of nan.
+---------------------------------------------------------------
+"""
+
+
+# Returns the match rows, alliance indices, stations and team ids of every team that played a match in the mask
+def get_team_appearances(table, mask):
+    rows, alliances, stations = np.nonzero(table.alliance_teams >= 0)
+    keep = mask[rows]
+    rows, alliances, stations = rows[keep], alliances[keep], stations[keep]
+    return rows, alliances, stations, table.alliance_teams[rows, alliances, stations]
+
+
+# Groups values by team id. Returns the ids of the teams with values, the index each team's values start at and their
+# count, and the values sorted by team then by value
+def group_by_team(team_ids, values):
+    order = np.lexsort((values, team_ids))
+    team_ids, values = team_ids[order], values[order]
+    starts = np.flatnonzero(np.r_[True, team_ids[1:] != team_ids[:-1]]) if len(team_ids) > 0 else np.array([], int)
+    counts = np.diff(np.r_[starts, len(team_ids)])
+    return team_ids[starts], starts, counts, values
+
+
+# Performs every calculation on the grouped values. Returns a dictionary of {calculation: array with a value per team}
+def reduce_groups(starts, counts, values, calculations):
+    if len(starts) == 0:
+        return {calculation: np.array([]) for calculation in calculations}
+
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+    reductions = {}
+    for calculation in calculations:
+        if calculation == 'mean':
+            reductions[calculation] = means
+        elif calculation == 'med':
+            # Values are sorted within each team, so the median is the middle value or the mean of the middle two
+            reductions[calculation] = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+        elif calculation == 'min':
+            reductions[calculation] = np.minimum.reduceat(values, starts)
+        elif calculation == 'max':
+            reductions[calculation] = np.maximum.reduceat(values, starts)
+        elif calculation == 'stdev':
+            squared_deviations = (values - np.repeat(means, counts)) ** 2
+            with np.errstate(divide='ignore', invalid='ignore'):
+                reductions[calculation] = np.sqrt(np.add.reduceat(squared_deviations, starts) / (counts - 1))
+        elif calculation == 'count':
+            reductions[calculation] = counts
+        else:
+            print("Make sure your calculation is either max, min, mean, med, count, or stdev")
+    return reductions
+
+
+@timer('aggregate')
+def team_field_statistics(table, field_name, calculations=['mean'], field_position_based=False,
+                          categorical_value=None, exclude_playoffs=True, event_key=None):
+    mask = table.mask(exclude_playoffs=exclude_playoffs, played_only=True, event_key=event_key)
+    rows, alliances, stations, team_ids = get_team_appearances(table, mask)
+
+    # Handles fields that are measured through a robot's position, ex. endgame location
+    if field_position_based:
+        if categorical_value is None:
+            print("You must specify a categorical_value to count occurrences of. See docstring for more info")
+            return
+        station_fields = {station: field_name + str(station + 1) for station in np.unique(stations)}
+        if not all(field in table.categorical_fields for field in station_fields.values()):
+            print(f"{field_name} isn't a position based field. Numeric fields need field_position_based=False")
+            return
+        value_id = table.string_ids.get(categorical_value, -2)
+        recorded = np.zeros(len(rows), dtype=bool)
+        for station, field in station_fields.items():
+            at_station = stations == station
+            column = table.categorical_fields[field]
+            recorded[at_station] = column[rows[at_station], alliances[at_station]] == value_id
+
+        counts = np.bincount(team_ids, minlength=len(table.team_keys))
+        recorded_counts = np.bincount(team_ids, weights=recorded, minlength=len(table.team_keys))
+        return {table.team_keys[team]: round(float(recorded_counts[team] / counts[team]), 3)
+                for team in np.flatnonzero(counts)}
+
+    if field_name not in table.numeric_fields:
+        print(f"{field_name} isn't a numeric field. Position based fields need field_position_based=True")
+        return
+
+    values = table.numeric_fields[field_name][rows, alliances]
+    teams, starts, counts, values = group_by_team(team_ids, values)
+    team_keys = [table.team_keys[team] for team in teams]
+
+    return {calculation: dict(zip(team_keys, reduction.tolist()))
+            for (calculation, reduction) in reduce_groups(starts, counts, values, calculations).items()}
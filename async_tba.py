@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import json
+import time
+from contextvars import copy_context
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from .instrumentation import record, timer
+
+"""
+asyncio TBA data handler used by AsyncTBADataHelper.
+
+Every request goes through one pooled aiohttp session and waits on a token bucket so a burst of concurrent requests
+stays under TBA's rate limit. If TBA still answers 429 Too Many Requests, the request is retried after the
+Retry-After delay, and a TBAErrorList is raised if the last retry is rate limited too. Responses are returned as plain
+JSON (lists and dictionaries) rather than tbapy model objects. Reads and writes to the response cache are made in the event loop's thread pool so they don't block other requests.
+
+aiohttp is only needed when this module is used, so it's imported on the first request. tbapy is only imported to
+raise its errors.
+
+Parameters:
+--------------------------------------------------------------
+auth_key: string = your TBA auth key.
+rate: float = the number of requests per second allowed on average. default = 10
+burst: int = the number of requests that can be sent at once before rate applies. default = 20
+max_connections: int = the number of connections kept open to TBA. default = 16
+max_retries: int = the number of times a rate limited request is retried. default = 3
+cache: response_cache = serve and revalidate responses through a response_cache (see cache.py). default=None
+read_url: string = the API url to request data from. Point this at a local server for testing. default=None (TBA)
+---------------------------------------------------------------
+"""
+
+
+# Runs a blocking function (ex. a solve or a SQLite query) in the event loop's default thread pool so other coroutines
+# keep running meanwhile. It runs in a copy of the caller's context so its records are kept against the calling method
+async def run_in_thread(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(copy_context().run, function, *args, **kwargs))
+
+
+# Returns the number of seconds a Retry-After header asks to wait. It's either a number of seconds or an HTTP date,
+# and default is used if it's missing or can't be read
+def get_retry_delay(retry_after, default=1.0):
+    if retry_after is None:
+        return default
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return default
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+
+class token_bucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    # Waits until a request is allowed to be sent
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class async_TBA:
+    READ_URL_PRE = 'https://www.thebluealliance.com/api/v3/'
+
+    def __init__(self, auth_key, rate=10, burst=20, max_connections=16, max_retries=3, cache=None, read_url=None):
+        self.auth_key = auth_key
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.response_cache = cache
+        if read_url is not None:
+            self.READ_URL_PRE = read_url
+
+        self.bucket = token_bucket(rate, burst)
+        # Created on the first request since it has to belong to a running event loop
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                                 headers={'X-TBA-Auth-Key': self.auth_key})
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, url):
+        cached = await run_in_thread(self.response_cache.get, url) if self.response_cache is not None else None
+        if cached is not None and cached['fresh']:
+            record('cache_hits')
+            return cached['data']
+
+        headers = {}
+        # Ask TBA to only send the data again if it has changed since it was stored
+        if cached is not None:
+            if cached['etag'] is not None:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified'] is not None:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        session = await self.get_session()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            record('requests')
+            start = time.perf_counter()
+            async with session.get(self.READ_URL_PRE + url, headers=headers) as response:
+                body = await response.read()
+                record('fetch', time.perf_counter() - start)
+                if response.status == 429 and attempt < self.max_retries:
+                    record('rate_limited')
+                    await asyncio.sleep(get_retry_delay(response.headers.get('Retry-After')))
+                    continue
+                if response.status == 304 and cached is not None:
+                    record('cache_revalidations')
+                    await run_in_thread(self.response_cache.refresh, url, cached['data'])
+                    return cached['data']
+
+                from tbapy.exceptions import TBAErrorList
+                if response.status == 429:
+                    raise TBAErrorList([('rate_limit', 'still rate limited after %s retries' % self.max_retries)])
+                with timer('parse'):
+                    try:
+                        raw = json.loads(body)
+                    except ValueError:
+                        if response.status == 200:
+                            raise
+                        raise TBAErrorList([('status_%s' % response.status, body.decode(errors='replace'))])
+                if isinstance(raw, dict) and raw.get('Errors') is not None:
+                    raise TBAErrorList([error.popitem() for error in raw['Errors']])
+                if response.status == 200 and self.response_cache is not None:
+                    await run_in_thread(self.response_cache.put, url, raw, response.headers.get('ETag'),
+                                        response.headers.get('Last-Modified'))
+                return raw
+
+    @staticmethod
+    def team_key(identifier):
+        return identifier if type(identifier) == str else 'frc%s' % identifier
+
+    async def team_events(self, team, year=None, keys=False):
+        if year:
+            return await self._get('team/%s/events/%s%s' % (self.team_key(team), year, '/keys' if keys else ''))
+        return await self._get('team/%s/events%s' % (self.team_key(team), '/keys' if keys else ''))
+
+    async def team_matches(self, team, event=None, year=None):
+        if event:
+            return await self._get('team/%s/event/%s/matches' % (self.team_key(team), event))
+        return await self._get('team/%s/matches/%s' % (self.team_key(team), year))
+
+    async def events(self, year, keys=False):
+        return await self._get('events/%s%s' % (year, '/keys' if keys else ''))
+
+    async def event_teams(self, event, keys=False):
+        return await self._get('event/%s/teams%s' % (event, '/keys' if keys else ''))
+
+    async def event_matches(self, event):
+        return await self._get('event/%s/matches' % event)
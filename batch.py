@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+from contextvars import copy_context
+from .utils import *
+from .solvers import *
+from .instrumentation import timer
+
+"""
+Calculates the contribution (CC) of every team at many events at once.
+
+Event matches are fetched concurrently by a pool of threads. Each event's system is then solved through its normal
+equations (see solvers.py), either in a pool of worker processes or, when solve_workers=0, in the fetching threads
+themselves. An event that fails doesn't stop the batch. Its error is returned instead.
+
+Parameters:
+--------------------------------------------------------------
+year: int = calculate CCs for every event in this year. Ignored if event_keys is given.
+event_keys: list<string> = the TBA keys of the events to calculate CCs for. default=None
+metric: string or list<string> = the TBA/FIRSTApi metric(s) to calculate contribution for. 'all' uses every numeric
+score_breakdown field of each event. default='totalPoints'
+exclude_playoffs: boolean = whether to exclude playoff matches from CC calculations. default = True
+fetch_workers: int = the number of events fetched from TBA at the same time. default = 8
+solve_workers: int = the number of processes solving events. None uses one per CPU and 0 solves in the fetching
+threads, which is faster when there are only a few events. Worker processes are started fresh (spawned) rather than
+forked, since forking while the fetching threads hold locks (ex. in requests or the response cache) can deadlock
+the workers. default = None
+
+Returns:
+event_CCs: dictionary = Keys are event keys with values being dictionaries of {team_key: CC, ...}. If metric is a list,
+or 'all', the values are {team_key: {metric: CC, ...}, ...}. Events without any played matches are left out.
+errors: dictionary = Keys are the event keys that couldn't be calculated with values being the error message
+---------------------------------------------------------------
+"""
+
+
+# Fetches an event's played matches and turns them into the arrays needed to solve for its CCs.
+# Returns None if the event doesn't have any played matches
+def load_event_system(authkey, event_key, metrics, exclude_playoffs=True):
+    return create_event_system(get_tba(authkey).event_matches(event=event_key), metrics, exclude_playoffs)
+
+
+# Turns an event's matches into the (team_keys, alliance_teams, alliance_scores, metrics) needed to solve for its CCs.
+# metrics can be 'all', which uses every numeric score_breakdown field of the event like event_OPR does.
+# Returns None if the event doesn't have any played matches
+def create_event_system(matches, metrics, exclude_playoffs=True):
+    matches = get_qualification_matches(matches) if exclude_playoffs else matches
+    matches = get_played_matches(matches)
+    if len(matches) == 0:
+        return None
+
+    metrics = get_numeric_fields(matches) if metrics == 'all' else metrics
+    with timer('matrix'):
+        team_keys, alliance_teams = create_alliance_indices(matches)
+        return team_keys, alliance_teams, create_alliance_scores(matches, metrics), metrics
+
+
+# Solves the arrays of a system loaded by load_event_system. Only takes arrays so it can be sent to a worker process
+def solve_event_system(team_keys, alliance_teams, alliance_scores):
+    with timer('matrix'):
+        normal_matrix = create_normal_matrix(alliance_teams, len(team_keys))
+        normal_vector = create_normal_vector(alliance_teams, len(team_keys), alliance_scores)
+    with timer('solve'):
+        return solve_normal_equations(normal_matrix, normal_vector)
+
+
+# Fetches and, if there's no process pool, solves a single event. Runs in the fetching threads
+def calculate_event_system(authkey, event_key, metrics, exclude_playoffs, solve_in_thread):
+    system = load_event_system(authkey, event_key, metrics, exclude_playoffs)
+    if system is None or not solve_in_thread:
+        return system, None
+    return system, solve_event_system(*system[:3])
+
+
+# Returns {team_key: CC, ...} for a single metric or {team_key: {metric: CC, ...}, ...} for a list of metrics or 'all'.
+# metrics are the names of the solutions' columns
+def create_event_CCs(team_keys, solutions, metric, metrics):
+    if isinstance(metric, str) and metric != 'all':
+        return {team: solutions[index][0] for (index, team) in enumerate(team_keys)}
+    return {team: dict(zip(metrics, solutions[index])) for (index, team) in enumerate(team_keys)}
+
+
+def season_OPRs(authkey, year=None, event_keys=None, metric='totalPoints', exclude_playoffs=True, fetch_workers=8,
+                solve_workers=None):
+    if event_keys is None:
+        event_keys = get_tba(authkey).events(year, keys=True)
+    metrics = metric if metric == 'all' else [metric] if isinstance(metric, str) else list(metric)
+    solve_in_thread = solve_workers == 0
+
+    event_CCs = {}
+    errors = {}
+    # Keys are event keys. Values are (team_keys, metrics, solutions) tuples, where solutions can be a future from
+    # the process pool
+    event_solutions = {}
+
+    process_pool = ProcessPoolExecutor(max_workers=solve_workers, mp_context=get_context('spawn')) \
+        if not solve_in_thread else None
+    try:
+        # Fetches run in the context of the caller so they're recorded against the calling method
+        with ThreadPoolExecutor(max_workers=fetch_workers) as thread_pool:
+            fetches = {event_key: thread_pool.submit(copy_context().run, calculate_event_system, authkey, event_key,
+                                                     metrics, exclude_playoffs, solve_in_thread)
+                       for event_key in event_keys}
+            for event_key, fetch in fetches.items():
+                try:
+                    system, solutions = fetch.result()
+                except Exception as error:
+                    errors[event_key] = repr(error)
+                    continue
+                if system is None:
+                    continue
+                if solutions is None:
+                    solutions = process_pool.submit(solve_event_system, *system[:3])
+                event_solutions[event_key] = (system[0], system[3], solutions)
+
+        for event_key, (team_keys, event_metrics, solutions) in event_solutions.items():
+            try:
+                solutions = solutions.result() if process_pool is not None else solutions
+            except Exception as error:
+                errors[event_key] = repr(error)
+                continue
+            event_CCs[event_key] = create_event_CCs(team_keys, solutions, metric, event_metrics)
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    return event_CCs, errors
@@ -0,0 +1,144 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from .TBADataHelper import TBADataHelper
+from .functions import get_field_statistic
+from .opr import event_OPR
+from .fake_tba import *
+from .instrumentation import STAGES, collect_stats
+
+"""
+Benchmarks every public calculation against a fake TBA backend (see fake_tba.py), so they can be measured without
+the real API. For each method it reports:
+- wall time: the fastest of repeat runs
+- requests: the number of TBA requests one run made
+- peak memory: the most memory allocated during one run, measured by tracemalloc in a separate run
+- stage times: the time the fastest run spent in each stage recorded by instrumentation.py (fetch, parse, matrix,
+solve and aggregate). Stages running in several threads at once are added up, so they can be more than the wall time
+
+It also measures how long importing the package and its main modules takes in a fresh interpreter, along with the
+heavy dependencies each import pulls in.
+
+Run it from the directory containing the package:
+python -m TBADataHelper.benchmark --events 10 --teams 40
+python -m TBADataHelper.benchmark --fixtures recorded_events.json --latency 0.05
+"""
+
+# Modules whose import time is measured, relative to the package
+IMPORT_MODULES = ['', '.TBADataHelper', '.AsyncTBADataHelper']
+# Dependencies that are slow to import
+HEAVY_MODULES = ['numpy', 'tbapy', 'requests', 'aiohttp']
+
+
+# Imports a module in a fresh interpreter repeat times. Returns a dictionary with the fastest import time and the heavy
+# dependencies the import loaded
+def benchmark_import(module, repeat=3):
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(time.perf_counter() - start)\n"
+            f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    # The package is imported by name, so the interpreter runs from the directory containing it
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    import_times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=package_parent, capture_output=True, text=True,
+                                check=True).stdout.split('\n')
+        import_times.append(float(output[0]))
+    return {'name': module, 'import_time': min(import_times), 'dependencies': output[1] or '-'}
+
+
+# Runs a benchmark case repeat times and returns a dictionary of its measurements
+def run_benchmark(name, function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        with collect_stats() as stats:
+            start = time.perf_counter()
+            function()
+            wall_time = time.perf_counter() - start
+        if best is None or wall_time < best['wall_time']:
+            # Some cases call the calculations directly rather than through a method, so every method is added up
+            totals = {}
+            for method_stats in stats.summary().values():
+                for (key, value) in method_stats.items():
+                    totals[key] = totals.get(key, 0) + value
+            best = {'name': name, 'wall_time': wall_time, 'requests': totals.get('requests', 0)}
+            best.update({stage: totals.get(stage, 0.0) for stage in STAGES})
+
+    # Tracing memory slows everything down, so it gets its own run
+    tracemalloc.start()
+    try:
+        function()
+        best['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best
+
+
+# Benchmarks every public method on the events. Returns a list of measurement dictionaries
+def benchmark_methods(events_data, latency=0, repeat=3):
+    install_fake_tba(events_data, latency)
+    try:
+        event_key = next(iter(events_data))
+        year = int(event_key[:4])
+        team_key = events_data[event_key][0]['alliances']['blue']['team_keys'][0]
+        fetcher = TBADataHelper('fake', year)
+
+        cases = [
+            ('get_field_statistic', lambda: get_field_statistic('fake', team_key, year, 'totalPoints', ['mean'])),
+            ('event_OPR', lambda: event_OPR('fake', event_key, 'totalPoints').calculate_contribution()),
+            ('get_team_field_statistics',
+             lambda: fetcher.get_team_field_statistics(team_key, 'totalPoints', ['mean', 'max'])),
+            ('get_team_OPR_statistic', lambda: fetcher.get_team_OPR_statistic(team_key, calculations=['mean'])),
+            ('get_event_field_statistics',
+             lambda: fetcher.get_event_field_statistics(event_key, 'totalPoints', ['mean', 'max'])),
+            ('get_event_field_statistics (position)',
+             lambda: fetcher.get_event_field_statistics(event_key, 'endgameRobot', field_position_based=True,
+                                                        categorical_value='Hang')),
+            ('get_event_OPRs', lambda: fetcher.get_event_OPRs(event_key)),
+            ('get_event_component_OPRs', lambda: fetcher.get_event_component_OPRs(event_key)),
+            ('get_season_OPRs', lambda: fetcher.get_season_OPRs(solve_workers=0)),
+            ('get_field_statistics_table',
+             lambda: fetcher.get_field_statistics_table('totalPoints', ['mean', 'med', 'stdev'])),
+        ]
+        return [run_benchmark(name, function, repeat) for (name, function) in cases]
+    finally:
+        set_tba_factory(None)
+
+
+def print_results(results):
+    print(f"{'method':<40}{'wall ms':>10}" + ''.join(f"{stage + ' ms':>13}" for stage in STAGES) +
+          f"{'requests':>10}{'peak KiB':>12}")
+    for result in results:
+        print(f"{result['name']:<40}{result['wall_time'] * 1000:>10.2f}" +
+              ''.join(f"{result[stage] * 1000:>13.2f}" for stage in STAGES) +
+              f"{result['requests']:>10}{result['peak_memory'] / 1024:>12.1f}")
+
+
+def print_import_results(results):
+    print(f"{'import':<40}{'ms':>10}  dependencies loaded")
+    for result in results:
+        print(f"{result['name']:<40}{result['import_time'] * 1000:>10.2f}  {result['dependencies']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TBADataHelper against a fake TBA backend')
+    parser.add_argument('--year', type=int, default=2020)
+    parser.add_argument('--events', type=int, default=10, help='number of synthetic events')
+    parser.add_argument('--teams', type=int, default=40, help='number of teams at each synthetic event')
+    parser.add_argument('--fixtures', help='replay events recorded by fake_tba.record_fixtures instead')
+    parser.add_argument('--latency', type=float, default=0, help='seconds every fake request takes')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    events_data = load_fixtures(args.fixtures) if args.fixtures else generate_season(args.year, args.events, args.teams)
+    print_results(benchmark_methods(events_data, args.latency, args.repeat))
+    print()
+    print_import_results([benchmark_import(__package__ + module, args.repeat) for module in IMPORT_MODULES])
+
+
+if __name__ == '__main__':
+    main()
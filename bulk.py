@@ -0,0 +1,155 @@
+import functools
+import threading
+from concurrent.futures import Future
+from .utils import *
+from .match_table import *
+from .aggregate import *
+from .instrumentation import record
+
+"""
+Bulk field statistics for many teams over many years from the smallest set of event level requests.
+
+Every team at an event shares the event's matches, so rather than requesting each team's matches the query is
+planned per year as a set of events to fetch with event_matches:
+- for a few teams, each team's events are requested and only those events are fetched
+- for many teams (or every team), the year's event list is requested once and every event is fetched
+whichever takes fewer requests. The fetched events are loaded into a MatchTable and every field and calculation is
+calculated for all of the teams at once (see aggregate.py). Only one year's matches are held at a time.
+
+All requests go through a deduplicated_TBA, so identical requests that are in flight at the same time are only sent
+once, and the small event lists are only requested once a year.
+
+Parameters:
+--------------------------------------------------------------
+team_keys: list<string> = the teams to calculate statistics for. None calculates them for every team
+years: list<int> = the years to calculate statistics for
+fields: list = the TBA fields under scoring_breakdown to get calculations for (ex. totalPoints). Position based fields
+are given as a (field_name, categorical_value) tuple, ex.) ('endgameRobot', 'Hang')
+calculations: list<string> = calculations to perform on numeric fields. mean, med, min, max, stdev, count. default=['mean']
+exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+fetch_workers: int = the number of events fetched from TBA at the same time. default = 8
+
+Returns:
+rows: list<dictionary> = one row per (team, year, field, calculation) with keys team_key, year, field, calculation and
+value. Position based fields have the calculation 'proportion'. Teams that didn't play in a year have no rows for it
+---------------------------------------------------------------
+"""
+
+# The number of events a team is expected to attend in a year, used to estimate the cost of fetching per team
+EVENTS_PER_TEAM = 3
+
+# Requests whose responses deduplicated_TBA keeps after they arrive. They're small lists of keys that are asked for
+# again (ex. a team's events), unlike matches, which load_match_table releases once they're in the table
+RETAINED_METHODS = {'events', 'team_events', 'event_teams'}
+
+
+"""
+TBA data handler that sends each distinct request only once. Calls with the same method and arguments made while a
+request is in flight wait for its response. Responses to RETAINED_METHODS are also stored for later calls. Every other
+response is dropped as soon as it has been handed to the calls waiting for it, so large responses like an event's
+matches aren't kept alive. Failed requests aren't stored.
+
+Parameters:
+--------------------------------------------------------------
+tba: TBA data handler = the handler to send requests through
+---------------------------------------------------------------
+"""
+
+
+class deduplicated_TBA:
+    def __init__(self, tba):
+        self.tba = tba
+
+        self.lock = threading.Lock()
+        # Keys are (method, args, kwargs) tuples. Values are futures of the responses in flight and of the stored
+        # responses to RETAINED_METHODS
+        self.responses = {}
+        self.request_count = 0
+        self.deduplicated_count = 0
+
+    def request(self, method, *args, **kwargs):
+        key = (method, args, tuple(sorted(kwargs.items())))
+        with self.lock:
+            response = self.responses.get(key)
+            first_request = response is None
+            if first_request:
+                response = self.responses[key] = Future()
+                self.request_count += 1
+            else:
+                self.deduplicated_count += 1
+
+        if not first_request:
+            record('deduplicated_requests')
+            return response.result()
+
+        try:
+            result = getattr(self.tba, method)(*args, **kwargs)
+        except Exception as error:
+            with self.lock:
+                del self.responses[key]
+            response.set_exception(error)
+            raise
+        # Calls already waiting hold the future, so it can be dropped before they're handed the result
+        if method not in RETAINED_METHODS:
+            with self.lock:
+                del self.responses[key]
+        response.set_result(result)
+        return result
+
+    # Every other attribute is a deduplicated request method, ex.) tba.event_matches(event='2020orore')
+    def __getattr__(self, method):
+        return functools.partial(self.request, method)
+
+
+# Returns the keys of the events to fetch for the teams in a year, choosing whichever of requesting every team's events
+# or the year's event list is expected to take fewer requests
+def plan_event_fetches(tba, team_keys, year):
+    year_event_keys = tba.events(year, keys=True)
+    if team_keys is None:
+        return year_event_keys
+
+    team_plan_cost = len(team_keys) + min(len(team_keys) * EVENTS_PER_TEAM, len(year_event_keys))
+    if team_plan_cost >= len(year_event_keys):
+        return year_event_keys
+
+    event_keys = set()
+    for team_key in team_keys:
+        event_keys.update(tba.team_events(team=team_key, year=year, keys=True))
+    # Keep the order TBA lists the year's events in
+    return [event_key for event_key in year_event_keys if event_key in event_keys]
+
+
+# Returns the tidy rows of every field and calculation for the teams in a table
+def create_statistics_rows(table, team_keys, year, fields, calculations, exclude_playoffs=True):
+    team_keys = set(team_keys) if team_keys is not None else None
+    rows = []
+    for field in fields:
+        if isinstance(field, str):
+            field_statistics = team_field_statistics(table, field, calculations, exclude_playoffs=exclude_playoffs)
+            field_name = field
+        else:
+            field_name, categorical_value = field
+            proportions = team_field_statistics(table, field_name, field_position_based=True,
+                                                categorical_value=categorical_value, exclude_playoffs=exclude_playoffs)
+            field_statistics = {'proportion': proportions} if proportions is not None else None
+        if field_statistics is None:
+            continue
+
+        for (calculation, team_values) in field_statistics.items():
+            for (team, value) in team_values.items():
+                if team_keys is None or team in team_keys:
+                    rows.append({'team_key': team, 'year': year, 'field': field_name, 'calculation': calculation,
+                                 'value': value})
+    return rows
+
+
+def bulk_field_statistics(authkey, team_keys, years, fields, calculations=['mean'], exclude_playoffs=True,
+                          fetch_workers=8):
+    rows = []
+    for year in years:
+        # Responses are only deduplicated within a year so the year's matches can be released after it
+        tba = deduplicated_TBA(get_tba(authkey))
+        table = load_match_table(authkey, event_keys=plan_event_fetches(tba, team_keys, year),
+                                 fetch_workers=fetch_workers, tba=tba)
+        rows += create_statistics_rows(table, team_keys, year, fields, calculations, exclude_playoffs)
+    return rows
@@ -0,0 +1,224 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+
+import requests
+from tbapy import TBA
+
+from .utils import set_tba_factory
+from .instrumentation import record, timer
+
+"""
+Persistent on-disk cache for TBA API responses.
+
+Responses are stored zlib compressed in a SQLite database keyed by request url. A stored response is served without
+touching the network until its time to live runs out. After that it is revalidated with If-None-Match/If-Modified-Since
+so an unchanged resource only costs a 304. Data about finished events never changes, so it's kept much longer than data
+that's still being played. An event is finished once its end date has passed (end dates are remembered from every
+event response that goes through the cache) or once every one of its matches, finals included, has been played.
+Anything from a past season is finished. Once the stored responses grow past max_size bytes, the least recently used
+ones are evicted.
+
+Usage:
+install_cache('tba_cache.sqlite') puts the cache underneath every TBA request made by the package.
+
+Parameters:
+--------------------------------------------------------------
+path: string = the SQLite database file to store responses in. ':memory:' keeps them in memory only.
+max_size: int = the maximum number of compressed bytes to keep before evicting responses. default = 256MB
+live_ttl: int = the number of seconds responses about events still being played are served without revalidation.
+default = 300
+finished_ttl: int = the number of seconds responses about finished events are served without revalidation. default = 30 days
+ttl_policy: function(url) -> int = overrides how many seconds a response for a given url is fresh for. default=None
+---------------------------------------------------------------
+"""
+
+
+class response_cache:
+    def __init__(self, path, max_size=256 * 1024 * 1024, live_ttl=300, finished_ttl=30 * 24 * 60 * 60,
+                 ttl_policy=None):
+        self.path = path
+        self.max_size = max_size
+        self.live_ttl = live_ttl
+        self.finished_ttl = finished_ttl
+        self.ttl_policy = ttl_policy
+
+        # The connection is shared between threads, so every use of it has to hold the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS event_end_dates (event_key TEXT PRIMARY KEY, end_date TEXT)")
+        self.connection.commit()
+
+    # Returns how many seconds a response for the given url should be served before it's revalidated, given its data.
+    # The lock must already be held
+    def get_ttl(self, url, data=None):
+        if self.ttl_policy is not None:
+            return self.ttl_policy(url)
+        # Event keys and years in TBA urls start a path segment with the 4 digit year, ex.) event/2019orore/matches
+        year = re.search(r'(?:^|/)(\d{4})(?=[a-z/]|$)', url)
+        if year is not None and int(year.group(1)) < datetime.now().year:
+            return self.finished_ttl
+
+        event_key = re.match(r'event/(\d{4}[a-z0-9]+)(?:/|$)', url)
+        if event_key is None:
+            return self.live_ttl
+        if re.match(r'event/[^/]+/matches$', url) and is_finished(data):
+            return self.finished_ttl
+        end_date = self.connection.execute("SELECT end_date FROM event_end_dates WHERE event_key = ?",
+                                           (event_key.group(1),)).fetchone()
+        if end_date is not None and end_date[0] < date.today().isoformat():
+            return self.finished_ttl
+        return self.live_ttl
+
+    # Remembers the end dates of the events in a response so responses about those events know when they're finished.
+    # The lock must already be held
+    def store_end_dates(self, data):
+        events = data if isinstance(data, list) else [data]
+        end_dates = [(event['key'], event['end_date']) for event in events
+                     if isinstance(event, dict) and event.get('key') and event.get('end_date')]
+        if end_dates:
+            self.connection.executemany("INSERT OR REPLACE INTO event_end_dates (event_key, end_date) VALUES (?, ?)",
+                                        end_dates)
+
+    # Returns a dictionary with the stored data, validators and whether it's still fresh, or None if the url isn't stored
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, etag, last_modified, expires FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.connection.commit()
+        body, etag, last_modified, expires = row
+        return {'data': json.loads(zlib.decompress(body)), 'etag': etag, 'last_modified': last_modified,
+                'fresh': expires > time.time()}
+
+    # Stores the data for a url along with the validators TBA sent with it
+    def put(self, url, data, etag=None, last_modified=None):
+        body = zlib.compress(json.dumps(data).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.store_end_dates(data)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, expires, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now + self.get_ttl(url, data), now, len(body)))
+            self.evict()
+            self.connection.commit()
+
+    # Marks a stored response as fresh again after TBA reported that it hasn't been modified. data is the stored data
+    def refresh(self, url, data=None):
+        with self.lock:
+            self.connection.execute("UPDATE responses SET expires = ? WHERE url = ?",
+                                    (time.time() + self.get_ttl(url, data), url))
+            self.connection.commit()
+
+    # Removes the least recently used responses until the cache fits in max_size. The lock must already be held
+    def evict(self):
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        for url, size in self.connection.execute(
+                "SELECT url, size FROM responses ORDER BY last_access").fetchall():
+            self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+    # Removes every stored response
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.execute("DELETE FROM event_end_dates")
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+"""
+TBA data handler that serves requests from a response_cache and revalidates stale responses with TBA.
+
+Parameters:
+--------------------------------------------------------------
+auth_key: string = your TBA auth key.
+cache: response_cache = the cache to read responses from and store them in.
+read_url: string = the API url to request data from. Point this at a local server for testing. default=None (TBA)
+---------------------------------------------------------------
+"""
+
+
+class cached_TBA(TBA):
+    def __init__(self, auth_key, cache, read_url=None):
+        super().__init__(auth_key)
+        self.auth_key = auth_key
+        self.response_cache = cache
+        # Plain session, since tbapy's own session already keeps an in-memory cache
+        self.cache_session = requests.Session()
+        if read_url is not None:
+            self.READ_URL_PRE = read_url
+
+    def _get(self, url):
+        cached = self.response_cache.get(url)
+        if cached is not None and cached['fresh']:
+            record('cache_hits')
+            return cached['data']
+
+        headers = {'X-TBA-Auth-Key': self.auth_key}
+        # Ask TBA to only send the data again if it has changed since it was stored
+        if cached is not None:
+            if cached['etag'] is not None:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified'] is not None:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        record('requests')
+        with timer('fetch'):
+            response = self.cache_session.get(self.READ_URL_PRE + url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            record('cache_revalidations')
+            self.response_cache.refresh(url, cached['data'])
+            return cached['data']
+
+        with timer('parse'):
+            raw = response.json()
+        self._detect_errors(raw)
+        if response.status_code == 200:
+            self.response_cache.put(url, raw, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return raw
+
+
+# Returns whether a list of an event's matches shows the event is over: every match, finals included, has been played
+def is_finished(matches):
+    if not isinstance(matches, list) or len(matches) == 0:
+        return False
+    played = [match.get('alliances', {}).get('red', {}).get('score', -1) >= 0 for match in matches]
+    return all(played) and any(match.get('comp_level') == 'f' for match in matches)
+
+
+# Puts a response_cache under every TBA request made by the package and returns it. Keyword arguments are passed on to
+# response_cache
+def install_cache(path='tba_cache.sqlite', read_url=None, **kwargs):
+    cache = response_cache(path, **kwargs)
+    set_tba_factory(lambda authkey: cached_TBA(authkey, cache, read_url))
+    return cache
+
+
+# Stops caching TBA requests
+def uninstall_cache():
+    set_tba_factory(None)
@@ -0,0 +1,163 @@
+import json
+import random
+import threading
+import time
+from tbapy.models import Event, Match, Team
+from .utils import *
+from .instrumentation import record, timer
+
+"""
+Fake TBA backend used by the benchmarks (and anything else that shouldn't hit the real API).
+
+fake_TBA answers the requests the package makes (events, event_matches, event_teams, team_events, team_matches) from
+a dictionary of {event_key: [match, ...]} and counts every request it answers. The matches can either be
+generated synthetically for events of any size with generate_event/generate_season, or recorded from the real API
+once with record_fixtures and replayed with load_fixtures.
+
+Usage:
+backend = install_fake_tba(generate_season(2020, event_count=10, team_count=40))
+fetcher = TBADataHelper('fake', 2020)
+fetcher.get_event_OPRs('2020ev0')
+print(backend.request_count)
+"""
+
+
+# Generates the matches of an event in the layout TBA returns them. Each team has a hidden strength split between
+# auto and teleop so OPRs have something to find. If match_count isn't given, every team plays about 12 qualification
+# matches. Qualification matches after played_count are left unplayed
+def generate_event(event_key, team_keys, match_count=None, playoff_count=8, played_count=None, seed=0):
+    rng = random.Random('%s-%s' % (event_key, seed))
+    if match_count is None:
+        match_count = max(1, len(team_keys) * 12 // 6)
+    if played_count is None:
+        played_count = match_count
+    strengths = {team: rng.uniform(5, 40) for team in team_keys}
+
+    def create_match(comp_level, set_number, match_number, played):
+        teams = rng.sample(team_keys, 6)
+        match_time = 1500000000 + match_number * 420 + set_number * 100000
+        match = {'key': '%s_%s%s' % (event_key, comp_level, match_number if comp_level == 'qm' else
+                                     '%sm%s' % (set_number, match_number)),
+                 'event_key': event_key, 'comp_level': comp_level, 'set_number': set_number,
+                 'match_number': match_number, 'time': match_time, 'actual_time': match_time if played else None,
+                 'alliances': {'blue': {'team_keys': teams[:3], 'score': -1},
+                               'red': {'team_keys': teams[3:], 'score': -1}},
+                 'score_breakdown': {} if played else None}
+        if not played:
+            return match
+
+        for (alliance_color, alliance) in [('blue', teams[:3]), ('red', teams[3:])]:
+            breakdown = {'autoPoints': max(0, round(sum(strengths[team] * 0.3 for team in alliance) + rng.gauss(0, 3))),
+                         'teleopPoints': max(0, round(sum(strengths[team] * 0.6 for team in alliance) + rng.gauss(0, 6))),
+                         'endgamePoints': 0, 'foulPoints': rng.choice([0, 0, 0, 3, 15])}
+            for (station, team) in enumerate(alliance):
+                endgame = rng.choices(['Hang', 'Park', 'None'], [strengths[team], 10, 10])[0]
+                breakdown['endgameRobot%s' % (station + 1)] = endgame
+                breakdown['endgamePoints'] += {'Hang': 25, 'Park': 5, 'None': 0}[endgame]
+            breakdown['totalPoints'] = (breakdown['autoPoints'] + breakdown['teleopPoints'] +
+                                        breakdown['endgamePoints'] + breakdown['foulPoints'])
+            breakdown['rp'] = rng.randint(0, 4)
+            match['score_breakdown'][alliance_color] = breakdown
+            match['alliances'][alliance_color]['score'] = breakdown['totalPoints']
+        return match
+
+    matches = [create_match('qm', 1, number + 1, number < played_count) for number in range(match_count)]
+    matches += [create_match('qf', number % 4 + 1, number // 4 + 1, True) for number in range(playoff_count)]
+    return matches
+
+
+# Generates a season of events. Teams are drawn from a shared pool so teams attend several events
+def generate_season(year, event_count=10, team_count=40, pool_size=None, seed=0):
+    rng = random.Random('%s-%s' % (year, seed))
+    pool = ['frc%s' % number for number in range(1, (pool_size or team_count * max(1, event_count // 3)) + 1)]
+    return {'%sev%s' % (year, event): generate_event('%sev%s' % (year, event), rng.sample(pool, team_count), seed=seed)
+            for event in range(event_count)}
+
+
+# Fetches the matches of events from the real API and writes them to a JSON fixture file
+def record_fixtures(authkey, path, event_keys):
+    tba = get_tba(authkey)
+    events_data = {event_key: [dict(match) for match in tba.event_matches(event=event_key)]
+                   for event_key in event_keys}
+    with open(path, 'w') as fixture:
+        json.dump(events_data, fixture)
+    return events_data
+
+
+# Reads a JSON fixture file written by record_fixtures
+def load_fixtures(path):
+    with open(path) as fixture:
+        return json.load(fixture)
+
+
+"""
+TBA data handler answering requests from a dictionary of {event_key: [match, ...]}.
+
+Parameters:
+--------------------------------------------------------------
+events_data: dictionary = the matches to answer requests from
+latency: float = seconds every request waits before it's answered, to imitate the network. default = 0
+---------------------------------------------------------------
+"""
+
+
+class fake_TBA:
+    def __init__(self, events_data, latency=0):
+        self.events_data = events_data
+        self.latency = latency
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    # Counts a request and waits out the fake latency
+    def request(self):
+        with self.lock:
+            self.request_count += 1
+        record('requests')
+        if self.latency:
+            with timer('fetch'):
+                time.sleep(self.latency)
+
+    @staticmethod
+    def team_key(identifier):
+        return identifier if type(identifier) == str else 'frc%s' % identifier
+
+    @staticmethod
+    def get_team_keys(match):
+        return match['alliances']['blue']['team_keys'] + match['alliances']['red']['team_keys']
+
+    def events(self, year, simple=False, keys=False):
+        self.request()
+        event_keys = [event for event in self.events_data if event[:4] == str(year)]
+        return event_keys if keys else [Event({'key': event, 'year': int(event[:4])}) for event in event_keys]
+
+    def event_matches(self, event, simple=False, keys=False):
+        self.request()
+        matches = self.events_data.get(event, [])
+        return [match['key'] for match in matches] if keys else [Match(match) for match in matches]
+
+    def event_teams(self, event, simple=False, keys=False):
+        self.request()
+        team_keys = sorted({team for match in self.events_data.get(event, []) for team in self.get_team_keys(match)})
+        return team_keys if keys else [Team({'key': team, 'team_number': int(team[3:])}) for team in team_keys]
+
+    def team_events(self, team, year=None, simple=False, keys=False):
+        self.request()
+        event_keys = [event for (event, matches) in self.events_data.items()
+                      if (not year or event[:4] == str(year)) and
+                      any(self.team_key(team) in self.get_team_keys(match) for match in matches)]
+        return event_keys if keys else [Event({'key': event, 'year': int(event[:4])}) for event in event_keys]
+
+    def team_matches(self, team, event=None, year=None, simple=False, keys=False):
+        self.request()
+        matches = [match for (event_key, event_matches) in self.events_data.items()
+                   if event_key == event or (not event and (not year or event_key[:4] == str(year)))
+                   for match in event_matches if self.team_key(team) in self.get_team_keys(match)]
+        return [match['key'] for match in matches] if keys else [Match(match) for match in matches]
+
+
+# Puts a fake_TBA underneath every TBA request made by the package. Returns it so its request_count can be read
+def install_fake_tba(events_data, latency=0):
+    backend = fake_TBA(events_data, latency)
+    set_tba_factory(lambda authkey: backend)
+    return backend
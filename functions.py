@@ -1,4 +1,3 @@
-from tbapy import TBA
 from .utils import *
 from statistics import mean, mode, stdev, median
 
@@ -17,19 +16,25 @@ field_position_based: boolean = whether the field is categorized in TBA based on
 categorical_value:string = the categorical value to get averages by
 exclude_playoff: boolean = whether to exclude playoff matches from calculations
 event_key: string = if specified, only include matches played at the given event in calculations.
+match_store: event_match_store = if specified, the team's matches are read from the already loaded event instead of TBA
 """
 
 
 def get_field_statistic(authkey, team_key, year, field_name, calculations=[],
-                         field_position_based=False, categorical_value=None, exclude_playoffs=True, event_key=None):
-    # TBA data handler
-    tba = TBA(authkey)
-
-    # Get list of team matches from TBA
-    if event_key:
-        matches = tba.team_matches(team=team_key, event=event_key)
+                         field_position_based=False, categorical_value=None, exclude_playoffs=True, event_key=None,
+                         match_store=None):
+    # Get list of team matches from the loaded event if there is one, otherwise from TBA
+    if match_store is not None:
+        matches = match_store.get_team_matches(team_key)
+        alliance_color, robot_number = match_store.get_alliance_color, match_store.get_robot_number
     else:
-        matches = tba.team_matches(team=team_key, year=year)
+        # TBA data handler
+        tba = get_tba(authkey)
+        if event_key:
+            matches = tba.team_matches(team=team_key, event=event_key)
+        else:
+            matches = tba.team_matches(team=team_key, year=year)
+        alliance_color, robot_number = get_alliance_color, get_robot_number
 
     matches = get_qualification_matches(matches) if exclude_playoffs else matches
 
@@ -44,14 +49,14 @@ def get_field_statistic(authkey, team_key, year, field_name, calculations=[],
         field_values = []
         for match in matches:
             # Finds the robot's position number in TBA
-            robot_position = str(get_robot_number(match, team_key))
+            robot_position = str(robot_number(match, team_key))
             field_values.append(
-                match['score_breakdown'][get_alliance_color(match, team_key)][field_name + robot_position])
+                match['score_breakdown'][alliance_color(match, team_key)][field_name + robot_position])
         return round(field_values.count(categorical_value) / len(field_values), 3) if len(
             field_values) != 0 else None
 
     # Creates a list of all the values for a particular field in every match a team played
-    field_values = [match["score_breakdown"][get_alliance_color(match, team_key)][field_name] for match in matches]
+    field_values = [match["score_breakdown"][alliance_color(match, team_key)][field_name] for match in matches]
 
     # Associates a calculation keyword to its appropriate function
     calculation_map = {'mean': mean, 'med': median, 'max': max, 'min': min, 'stdev': stdev, 'count': len}
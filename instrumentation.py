@@ -0,0 +1,141 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+"""
+Counters and timers for the work done by every TBADataHelper method.
+
+The package reports what it does through record(): every HTTP request to TBA is counted, and time is split into
+these stages:
+- fetch: waiting on TBA for a response
+- parse: decoding responses and turning matches into tables or indexes
+- matrix: building alliance matrices and normal equations
+- solve: solving for contributions
+- aggregate: calculating statistics from field values
+- simulate: predicting and simulating match outcomes
+Each record is tagged with the TBADataHelper method that caused it (or None outside of one).
+
+Stats are collected by:
+- collect_stats(), a context manager that collects everything recorded while it's active
+- add_hook(), which calls a function with every record, ex.) to export them to a metrics system
+
+Usage:
+with collect_stats() as stats:
+    fetcher.get_event_OPRs('2020orore')
+print(stats.summary())
+# {'get_event_OPRs': {'calls': 1, 'requests': 1, 'fetch': 0.21, 'parse': 0.01, 'matrix': 0.001, 'solve': 0.0004, ...}}
+
+Solves done in get_season_OPRs' worker processes happen outside this process and aren't recorded.
+"""
+
+STAGES = ['fetch', 'parse', 'matrix', 'solve', 'aggregate', 'simulate']
+
+# The TBADataHelper method currently running. Only the outermost method is recorded when methods call each other
+current_method = ContextVar('current_method', default=None)
+
+# Active collectors and hooks. Changed under the lock and copied before use so threads can record at any time
+lock = threading.Lock()
+collectors = []
+hooks = []
+
+
+class call_stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Keys are (method, name) tuples. Values are counts for counters and seconds for stages
+        self.counters = {}
+        self.timers = {}
+
+    def add(self, method, name, seconds, count):
+        with self.lock:
+            if name in STAGES:
+                self.timers[(method, name)] = self.timers.get((method, name), 0.0) + seconds
+            else:
+                self.counters[(method, name)] = self.counters.get((method, name), 0) + count
+
+    # Returns a dictionary of {method: {counter or stage: value, ...}, ...}
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for ((method, name), value) in list(self.counters.items()) + list(self.timers.items()):
+                summary.setdefault(method, {})[name] = value
+            return summary
+
+
+# Records a counter (ex. 'requests') or the seconds spent in a stage for the current method
+def record(name, seconds=0.0, count=1):
+    method = current_method.get()
+    with lock:
+        active_collectors, active_hooks = list(collectors), list(hooks)
+    for collector in active_collectors:
+        collector.add(method, name, seconds, count)
+    for hook in active_hooks:
+        hook({'method': method, 'name': name, 'seconds': seconds, 'count': count})
+
+
+# Records the time spent inside the with block as the given stage
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+# Collects every record made while the with block is active. Yields a call_stats
+@contextmanager
+def collect_stats():
+    stats = call_stats()
+    with lock:
+        collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        with lock:
+            collectors.remove(stats)
+
+
+# Calls hook(record) with every record, where record is {'method': ..., 'name': ..., 'seconds': ..., 'count': ...}
+def add_hook(hook):
+    with lock:
+        hooks.append(hook)
+
+
+def remove_hook(hook):
+    with lock:
+        hooks.remove(hook)
+
+
+# Decorator for TBADataHelper methods. Tags every record made during the method with its name and counts the call
+def instrumented(function):
+    def start():
+        if current_method.get() is not None:
+            return None
+        token = current_method.set(function.__name__)
+        record('calls')
+        return token
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            token = start()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                if token is not None:
+                    current_method.reset(token)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = start()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if token is not None:
+                current_method.reset(token)
+    return wrapper
@@ -0,0 +1,114 @@
+import numpy as np
+from .utils import *
+from .solvers import *
+from .instrumentation import timer
+
+"""
+This class keeps the contributed contribution (CC) of all the teams at an event up to date as matches are played,
+without rebuilding and re-solving the whole system after every match.
+
+It stores the Cholesky factor of the normal equations A^T A + regularization * I and the vector A^T b. Each new
+alliance is a rank-1 update of the factor and a teams-sized addition to the vector, so ingesting a match and
+re-solving only costs a few small triangular solves. Teams that appear partway through the event are added as new
+columns. The small regularization keeps the factor valid before every team has played enough matches. Its bias is
+removed when solving by iterative refinement with the same factor (see solvers.regularized_cholesky_solve), so the CCs
+match event_OPR's: to about 1e-12 once every team's contribution is determined, and to about 1e-5 of the same minimum
+norm answer before then.
+
+A match is only ingested once. Score corrections to an already ingested match aren't picked up.
+
+Parameters:
+--------------------------------------------------------------
+event_key: string = the TBA key of an event.
+metric: string or list<string> = the TBA/FIRSTApi metric(s) to calculate contribution for.
+exclude_playoffs: boolean = whether to include playoff matches in CC calculations. Default = True
+regularization: float = added to the diagonal of the normal equations to keep them factorable. It doesn't bias the
+CCs. Default = 1e-6
+matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+
+Returns:
+calculated_contribution: dictionary {team_key: CC, ...} = A dictionary with keys being TBA team_keys and values being the team's CC at the event
+for the first metric
+---------------------------------------------------------------
+"""
+
+
+class live_event_OPR:
+    def __init__(self, authkey, event_key, metric, exclude_playoffs=True, regularization=1e-6, matches=None):
+        self.authkey = authkey
+        # Which event to calculate contributions for
+        self.event_key = event_key
+        # Which metrics to calculate contribution by
+        self.metrics = [metric] if isinstance(metric, str) else list(metric)
+        self.exclude_playoffs = exclude_playoffs
+        self.regularization = regularization
+
+        # Keys are the team-key. Value is the team's column index in the normal equations
+        self.team_matrix_map = {}
+        # Lower triangular Cholesky factor of A^T A + regularization * I
+        self.normal_factor = np.zeros((0, 0))
+        # A^T b with one column per metric
+        self.normal_vector = np.zeros((0, len(self.metrics)))
+        # Keys of the matches that have already been ingested
+        self.match_keys = set()
+
+        if matches is None:
+            self.refresh()
+        else:
+            self.add_matches(matches)
+
+    # Fetches the event's matches from TBA and ingests the ones that have been played since the last refresh.
+    # Returns the number of matches that were ingested
+    def refresh(self):
+        return self.add_matches(get_tba(self.authkey).event_matches(event=self.event_key))
+
+    # Ingests every played match that hasn't been ingested yet. Returns the number of matches that were ingested
+    def add_matches(self, matches):
+        with timer('matrix'):
+            return sum(self.add_match(match) for match in matches)
+
+    # Ingests a single match if it has been played and hasn't been ingested yet. Returns whether it was ingested
+    def add_match(self, match):
+        if match['key'] in self.match_keys or match['score_breakdown'] is None:
+            return False
+        if self.exclude_playoffs and match['comp_level'] != 'qm':
+            return False
+
+        for alliance_color in ['blue', 'red']:
+            columns = [self.add_team(team) for team in match['alliances'][alliance_color]['team_keys']]
+            scores = [match['score_breakdown'][alliance_color][metric] for metric in self.metrics]
+
+            alliance = np.zeros(len(self.team_matrix_map))
+            alliance[columns] = 1
+            cholesky_update(self.normal_factor, alliance, min(columns))
+            self.normal_vector[columns] += scores
+
+        self.match_keys.add(match['key'])
+        return True
+
+    # Returns the team's column, adding a new one if the team hasn't been seen yet
+    def add_team(self, team_key):
+        if team_key not in self.team_matrix_map:
+            team_count = len(self.team_matrix_map)
+            self.team_matrix_map[team_key] = team_count
+
+            # A team without any matches only adds the regularization to the diagonal, so the factor just grows by
+            # one row and column
+            normal_factor = np.zeros((team_count + 1, team_count + 1))
+            normal_factor[:team_count, :team_count] = self.normal_factor
+            normal_factor[team_count, team_count] = np.sqrt(self.regularization)
+            self.normal_factor = normal_factor
+            self.normal_vector = np.vstack([self.normal_vector, np.zeros(len(self.metrics))])
+        return self.team_matrix_map[team_key]
+
+    # This function solves the normal equations and returns a dictionary of team_keys and their CCs for the first metric
+    def calculate_contribution(self):
+        with timer('solve'):
+            solutions = regularized_cholesky_solve(self.normal_factor, self.normal_vector, self.regularization)
+        return {team: solutions[index][0] for (index, team) in enumerate(self.team_matrix_map)}
+
+    # This function solves the normal equations and returns a dictionary of team_keys and their CCs per metric
+    def calculate_contributions(self):
+        with timer('solve'):
+            solutions = regularized_cholesky_solve(self.normal_factor, self.normal_vector, self.regularization)
+        return {team: dict(zip(self.metrics, solutions[index])) for (index, team) in enumerate(self.team_matrix_map)}
@@ -0,0 +1,86 @@
+import numpy as np
+from .instrumentation import timer
+
+"""
+Index of where every team played in a set of matches, built in one pass so lookups never scan alliance lists.
+
+- (match_key, team_key) -> (alliance_color, robot_number) in a dictionary, for O(1) drop in replacements of
+utils.get_alliance_color and utils.get_robot_number
+- team_key -> the team's appearances as (match rows, alliance indices, stations) arrays. Appearances are grouped by team
+(compressed sparse rows) so a team's are one slice, ready to be used as gather indices into per-match arrays
+- team_key -> the events the team played at
+
+Parameters:
+--------------------------------------------------------------
+matches: iterable = the matches to index. Rows refer to positions in this list
+---------------------------------------------------------------
+"""
+
+ALLIANCE_COLORS = ['blue', 'red']
+
+
+class match_index:
+    def __init__(self, matches):
+        self.matches = matches if isinstance(matches, list) else list(matches)
+        with timer('parse'):
+            self.create_index()
+
+    def create_index(self):
+        # Keys are (match_key, team_key) tuples. Values are (alliance_color, robot_number) tuples
+        self.team_positions = {}
+        # Keys are team keys in the order they first appear. Values are the team's id
+        self.team_ids = {}
+
+        team_ids = []
+        rows = []
+        alliances = []
+        stations = []
+        for (row, match) in enumerate(self.matches):
+            for (alliance, alliance_color) in enumerate(ALLIANCE_COLORS):
+                for (station, team) in enumerate(match['alliances'][alliance_color]['team_keys']):
+                    self.team_positions[(match['key'], team)] = (alliance_color, station + 1)
+                    team_ids.append(self.team_ids.setdefault(team, len(self.team_ids)))
+                    rows.append(row)
+                    alliances.append(alliance)
+                    stations.append(station)
+
+        # Sort the appearances by team, keeping each team's in match order. Team i's appearances are at
+        # team_offsets[i]:team_offsets[i + 1]
+        team_ids = np.array(team_ids, dtype=np.intp)
+        order = np.argsort(team_ids, kind='stable')
+        self.rows = np.array(rows, dtype=np.intp)[order]
+        self.alliances = np.array(alliances, dtype=np.intp)[order]
+        self.stations = np.array(stations, dtype=np.intp)[order]
+        self.team_offsets = np.r_[0, np.cumsum(np.bincount(team_ids, minlength=len(self.team_ids)))]
+
+    # Returns the keys of every team that appeared in the matches, in the order they first appear
+    def get_team_keys(self):
+        return list(self.team_ids)
+
+    # Returns (match rows, alliance indices, stations) of every match the team played in. Stations start at 0
+    def get_team_appearances(self, team_key):
+        team = self.team_ids.get(team_key)
+        if team is None:
+            return self.rows[:0], self.alliances[:0], self.stations[:0]
+        start, end = self.team_offsets[team], self.team_offsets[team + 1]
+        return self.rows[start:end], self.alliances[start:end], self.stations[start:end]
+
+    # Returns every match the team played in, in the order of the indexed matches
+    def get_team_matches(self, team_key):
+        return [self.matches[row] for row in self.get_team_appearances(team_key)[0]]
+
+    # Returns the keys of every event the team played at, in the order of the indexed matches
+    def get_team_events(self, team_key):
+        return list(dict.fromkeys(self.matches[row]['event_key'] for row in self.get_team_appearances(team_key)[0]))
+
+    # Returns the (alliance_color, robot_number) the team played in a match, or (None, None) if they didn't play in it
+    def get_position(self, match, team_key):
+        return self.team_positions.get((match['key'], team_key), (None, None))
+
+    # Drop in replacement for utils.get_alliance_color that reads from the index instead of scanning the match
+    def get_alliance_color(self, match, team_key):
+        return self.get_position(match, team_key)[0]
+
+    # Drop in replacement for utils.get_robot_number that reads from the index instead of scanning the match
+    def get_robot_number(self, match, team_key):
+        return self.team_positions[(match['key'], team_key)][1]
@@ -0,0 +1,42 @@
+from .utils import *
+from .match_index import *
+
+"""
+This class loads all of the matches at an event with a single TBA request and indexes them by team so that
+statistics for every team at the event can be calculated without requesting each team's matches separately.
+
+Parameters:
+--------------------------------------------------------------
+event_key: string = the TBA key of an event.
+matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+---------------------------------------------------------------
+"""
+
+
+class event_match_store:
+    def __init__(self, authkey, event_key, matches=None):
+        # Which event the matches were loaded from
+        self.event_key = event_key
+        if matches is None:
+            # TBA data handler
+            self.tba = get_tba(authkey)
+            matches = self.tba.event_matches(event=event_key)
+        # Where every team played in every match (see match_index.py)
+        self.index = match_index(matches)
+        self.matches = self.index.matches
+
+    # Returns the keys of every team that appeared in a match at the event
+    def get_team_keys(self):
+        return self.index.get_team_keys()
+
+    # Returns every match the team played at the event. Unplayed and playoff matches are not filtered out
+    def get_team_matches(self, team_key):
+        return self.index.get_team_matches(team_key)
+
+    # Drop in replacement for utils.get_alliance_color that reads from the index instead of scanning the match
+    def get_alliance_color(self, match, team_key):
+        return self.index.get_alliance_color(match, team_key)
+
+    # Drop in replacement for utils.get_robot_number that reads from the index instead of scanning the match
+    def get_robot_number(self, match, team_key):
+        return self.index.get_robot_number(match, team_key)
@@ -0,0 +1,289 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from contextvars import copy_context
+from .utils import *
+from .instrumentation import timer
+
+"""
+Columnar table of matches built once from the nested match dictionaries TBA returns.
+
+Each column is a NumPy array with one entry per match, or one per (match, alliance) for alliance data with blue
+always at alliance index 0 and red at 1. Teams, events and text values are stored as integer ids into string tables,
+and every score_breakdown field becomes its own column:
+- numbers and booleans are float arrays of shape (matches, 2) with NaN where a match has no value
+- text (ex. endgameRobot1 = 'Hang') is an int array of shape (matches, 2) of ids into strings, with -1 where missing
+
+Filters such as qualification only, played only or a single team/event are boolean masks over the matches, so
+selecting and aggregating matches never walks the dictionaries again.
+
+Parameters:
+--------------------------------------------------------------
+matches: iterable = the matches to store. Can be a generator, so a season can be loaded event by event without
+keeping every match dictionary in memory.
+---------------------------------------------------------------
+"""
+
+# comp_level values in the order they're played
+COMP_LEVELS = ['qm', 'ef', 'qf', 'sf', 'f']
+ALLIANCE_COLORS = ['blue', 'red']
+# Columns with one entry per match
+MATCH_COLUMNS = ['match_keys', 'match_events', 'comp_levels', 'set_numbers', 'match_numbers', 'times', 'played',
+                 'scores', 'alliance_teams']
+
+
+class MatchTable:
+    def __init__(self, matches=()):
+        # String tables that ids in the columns point into
+        self.team_keys = []
+        self.event_keys = []
+        self.strings = []
+        self.team_ids = {}
+        self.event_ids = {}
+        self.string_ids = {}
+
+        # Matches can come from a generator that fetches them, so only the columns built from them are timed
+        self.create_columns(matches)
+        # Every team's appearances grouped by team. Built the first time it's needed (see get_team_index)
+        self.team_index = None
+
+    def __len__(self):
+        return len(self.match_keys)
+
+    # Creates a MatchTable from columns that were already built, ex.) loaded from a snapshot
+    @classmethod
+    def from_columns(cls, columns, team_keys, event_keys, strings, numeric_fields, categorical_fields, field_types):
+        table = cls.__new__(cls)
+        for column in MATCH_COLUMNS:
+            setattr(table, column, columns[column])
+        table.team_keys, table.event_keys, table.strings = list(team_keys), list(event_keys), list(strings)
+        table.team_ids = {team: index for (index, team) in enumerate(table.team_keys)}
+        table.event_ids = {event: index for (index, event) in enumerate(table.event_keys)}
+        table.string_ids = {string: index for (index, string) in enumerate(table.strings)}
+        table.numeric_fields = dict(numeric_fields)
+        table.categorical_fields = dict(categorical_fields)
+        table.field_types = dict(field_types)
+        table.team_index = None
+        return table
+
+    # This function makes a single pass over the matches and turns them into columns
+    def create_columns(self, matches):
+        match_keys = []
+        match_events = []
+        comp_levels = []
+        set_numbers = []
+        match_numbers = []
+        times = []
+        played = []
+        # Flat list of every team on every alliance and how many teams are on each alliance
+        alliance_teams = []
+        alliance_sizes = []
+        scores = []
+        # Keys are score_breakdown fields. Values are ([alliance row index], [value]) for every alliance with the field
+        breakdown_values = {}
+
+        for (row, match) in enumerate(matches):
+            match_keys.append(match['key'])
+            match_events.append(self.get_id(self.event_ids, self.event_keys, match['event_key']))
+            comp_levels.append(COMP_LEVELS.index(match['comp_level']) if match['comp_level'] in COMP_LEVELS else -1)
+            set_numbers.append(match.get('set_number') or 0)
+            match_numbers.append(match.get('match_number') or 0)
+            match_time = match.get('actual_time') or match.get('time')
+            times.append(match_time if match_time is not None else np.nan)
+            played.append(match['score_breakdown'] is not None)
+
+            for (alliance, alliance_color) in enumerate(ALLIANCE_COLORS):
+                team_keys = match['alliances'][alliance_color]['team_keys']
+                alliance_teams.extend(self.get_id(self.team_ids, self.team_keys, team) for team in team_keys)
+                alliance_sizes.append(len(team_keys))
+                score = match['alliances'][alliance_color].get('score')
+                scores.append(score if score is not None else np.nan)
+
+                if match['score_breakdown'] is not None:
+                    for (field, value) in match['score_breakdown'][alliance_color].items():
+                        rows, values = breakdown_values.setdefault(field, ([], []))
+                        rows.append(row * 2 + alliance)
+                        values.append(value)
+
+        with timer('parse'):
+            self.store_columns(match_keys, match_events, comp_levels, set_numbers, match_numbers, times, played,
+                               scores, alliance_teams, alliance_sizes, breakdown_values)
+
+    # Turns the lists collected by create_columns into arrays
+    def store_columns(self, match_keys, match_events, comp_levels, set_numbers, match_numbers, times, played, scores,
+                      alliance_teams, alliance_sizes, breakdown_values):
+        self.match_keys = np.array(match_keys, dtype=str)
+        self.match_events = np.array(match_events, dtype=np.int32)
+        self.comp_levels = np.array(comp_levels, dtype=np.int8)
+        self.set_numbers = np.array(set_numbers, dtype=np.int32)
+        self.match_numbers = np.array(match_numbers, dtype=np.int32)
+        self.times = np.array(times, dtype=float)
+        self.played = np.array(played, dtype=bool)
+        self.scores = np.array(scores, dtype=float).reshape(-1, 2)
+
+        # Team ids of shape (matches, 2, teams per alliance), padded with -1 for alliances with fewer teams
+        alliance_sizes = np.array(alliance_sizes, dtype=np.intp)
+        width = alliance_sizes.max() if len(alliance_sizes) > 0 else 0
+        self.alliance_teams = np.full((len(alliance_sizes), width), -1, dtype=np.int32)
+        rows = np.repeat(np.arange(len(alliance_sizes)), alliance_sizes)
+        stations = np.arange(len(alliance_teams)) - np.repeat(np.cumsum(alliance_sizes) - alliance_sizes,
+                                                              alliance_sizes)
+        self.alliance_teams[rows, stations] = alliance_teams
+        self.alliance_teams = self.alliance_teams.reshape(len(match_keys), 2, width)
+
+        # Keys are score_breakdown fields. Values are the field's column
+        self.numeric_fields = {}
+        self.categorical_fields = {}
+        # Keys are score_breakdown fields. Values are 'int', 'float', 'bool' or 'str', used to turn rows back into
+        # dictionaries
+        self.field_types = {}
+        for (field, (rows, values)) in breakdown_values.items():
+            self.add_field(field, np.array(rows, dtype=np.intp), values)
+
+    # Stores a score_breakdown field as a numeric or categorical column. Fields holding lists or dictionaries aren't
+    # stored
+    def add_field(self, field, rows, values):
+        value_types = {type(value) for value in values if value is not None}
+        if len(value_types) == 0 or not value_types <= {int, float, bool, str}:
+            return
+
+        if str in value_types:
+            column = np.full(len(self) * 2, -1, dtype=np.int32)
+            column[rows] = [self.get_id(self.string_ids, self.strings, value) if isinstance(value, str) else -1
+                            for value in values]
+            self.categorical_fields[field] = column.reshape(-1, 2)
+            self.field_types[field] = 'str'
+        else:
+            column = np.full(len(self) * 2, np.nan)
+            column[rows] = [value if value is not None else np.nan for value in values]
+            self.numeric_fields[field] = column.reshape(-1, 2)
+            self.field_types[field] = 'bool' if value_types == {bool} else 'int' if value_types == {int} else 'float'
+
+    # Returns the id of a string in a string table, adding it if it isn't there yet
+    @staticmethod
+    def get_id(ids, table, value):
+        if value not in ids:
+            ids[value] = len(table)
+            table.append(value)
+        return ids[value]
+
+    # Returns a boolean mask of the matches that pass every given filter
+    def mask(self, exclude_playoffs=False, played_only=False, team_key=None, event_key=None):
+        mask = np.ones(len(self), dtype=bool)
+        if exclude_playoffs:
+            mask &= self.comp_levels == COMP_LEVELS.index('qm')
+        if played_only:
+            mask &= self.played
+        if team_key is not None:
+            team_mask = np.zeros(len(self), dtype=bool)
+            team_mask[self.get_team_positions(team_key)[0]] = True
+            mask &= team_mask
+        if event_key is not None:
+            mask &= self.match_events == self.event_ids.get(event_key, -2)
+        return mask
+
+    # Returns a new MatchTable holding only the matches in the mask. String tables are shared with this table
+    def select(self, mask):
+        table = MatchTable.__new__(MatchTable)
+        table.__dict__.update(self.__dict__)
+        for column in MATCH_COLUMNS:
+            setattr(table, column, getattr(self, column)[mask])
+        table.numeric_fields = {field: column[mask] for (field, column) in self.numeric_fields.items()}
+        table.categorical_fields = {field: column[mask] for (field, column) in self.categorical_fields.items()}
+        table.team_index = None
+        return table
+
+    # Groups every team's appearances by team id (compressed sparse rows). Returns (offsets, rows, alliances, stations)
+    # where team i's match rows, alliance indices and stations are at offsets[i]:offsets[i + 1], in match order
+    def get_team_index(self):
+        if self.team_index is None:
+            with timer('parse'):
+                rows, alliances, stations = np.nonzero(self.alliance_teams >= 0)
+                team_ids = self.alliance_teams[rows, alliances, stations]
+                order = np.argsort(team_ids, kind='stable')
+                offsets = np.r_[0, np.cumsum(np.bincount(team_ids, minlength=len(self.team_keys)))]
+                self.team_index = (offsets, rows[order], alliances[order], stations[order])
+        return self.team_index
+
+    # Returns (match rows, alliance indices, stations) of every match in the mask the team played in. Stations start at 0
+    def get_team_positions(self, team_key, mask=None):
+        offsets, rows, alliances, stations = self.get_team_index()
+        team = self.team_ids.get(team_key)
+        start, end = (offsets[team], offsets[team + 1]) if team is not None else (0, 0)
+        rows, alliances, stations = rows[start:end], alliances[start:end], stations[start:end]
+        if mask is not None:
+            keep = mask[rows]
+            rows, alliances, stations = rows[keep], alliances[keep], stations[keep]
+        return rows, alliances, stations
+
+    # Returns the keys of every event the team played at, in the order they first appear in the table
+    def get_team_events(self, team_key):
+        events = self.match_events[self.get_team_positions(team_key)[0]]
+        return [self.event_keys[event] for event in dict.fromkeys(events.tolist())]
+
+    # Returns the value of a field for the team's alliance in every match in the mask the team played in.
+    # Categorical fields are returned as their string values
+    def get_team_field_values(self, team_key, field_name, mask=None):
+        rows, alliances, _ = self.get_team_positions(team_key, mask)
+        if field_name in self.numeric_fields:
+            return self.numeric_fields[field_name][rows, alliances]
+        return np.array(self.strings + [None], dtype=object)[self.categorical_fields[field_name][rows, alliances]]
+
+    # Turns a row back into a match dictionary in the same layout TBA uses. Only the fields stored in the table are
+    # included, and score_breakdown fields that were missing from the match are left out
+    def get_match(self, row):
+        played = bool(self.played[row])
+        match_time = None if np.isnan(self.times[row]) else int(self.times[row])
+        match = {'key': str(self.match_keys[row]), 'event_key': self.event_keys[self.match_events[row]],
+                 'comp_level': COMP_LEVELS[self.comp_levels[row]] if self.comp_levels[row] >= 0 else None,
+                 'set_number': int(self.set_numbers[row]), 'match_number': int(self.match_numbers[row]),
+                 'time': match_time, 'actual_time': match_time if played else None,
+                 'alliances': {}, 'score_breakdown': {} if played else None}
+
+        for (alliance, alliance_color) in enumerate(ALLIANCE_COLORS):
+            score = self.scores[row, alliance]
+            match['alliances'][alliance_color] = {
+                'team_keys': [self.team_keys[team] for team in self.alliance_teams[row, alliance] if team >= 0],
+                'score': None if np.isnan(score) else int(score)}
+            if not played:
+                continue
+
+            breakdown = {}
+            for (field, column) in self.numeric_fields.items():
+                value = column[row, alliance]
+                if not np.isnan(value):
+                    breakdown[field] = {'int': int, 'bool': bool}.get(self.field_types[field], float)(value)
+            for (field, column) in self.categorical_fields.items():
+                if column[row, alliance] >= 0:
+                    breakdown[field] = self.strings[column[row, alliance]]
+            match['score_breakdown'][alliance_color] = breakdown
+        return match
+
+
+# Fetches the matches of every event in a year (or a list of events) concurrently and loads them into a MatchTable.
+# Each event's match dictionaries are discarded once they've been added to the table. Requests are sent through tba if
+# it's given, otherwise through a new TBA data handler for each event
+def load_match_table(authkey, year=None, event_keys=None, fetch_workers=8, tba=None):
+    if event_keys is None:
+        event_keys = (tba or get_tba(authkey)).events(year, keys=True)
+
+    def fetch(event_key):
+        return (tba or get_tba(authkey)).event_matches(event=event_key)
+
+    # Keeps a window of fetch_workers * 2 events fetching or waiting to be added, in the order of event_keys. An event's
+    # matches are let go of once they're added, before waiting on the next event. Fetches run in the context of the
+    # caller so they're recorded against the calling method
+    def fetch_matches(thread_pool):
+        remaining_keys = iter(event_keys)
+        fetches = deque(thread_pool.submit(copy_context().run, fetch, event_key)
+                        for event_key in islice(remaining_keys, fetch_workers * 2))
+        while fetches:
+            matches = fetches.popleft().result()
+            for event_key in islice(remaining_keys, 1):
+                fetches.append(thread_pool.submit(copy_context().run, fetch, event_key))
+            yield from matches
+            del matches
+
+    with ThreadPoolExecutor(max_workers=fetch_workers) as thread_pool:
+        return MatchTable(fetch_matches(thread_pool))
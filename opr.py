@@ -1,86 +1,167 @@
 import numpy as np
 from .utils import *
-from tbapy import TBA
-
-# Log full length arrays in the console
-np.set_printoptions(threshold=np.inf)
+from .solvers import *
+from .instrumentation import timer
 
 """
-This class calculates the contributed contribution (CC) of all the teams at an event for one given metric.
+This class calculates the contributed contribution (CC) of all the teams at an event for one or more metrics.
 
 Parameters:
 --------------------------------------------------------------
 event_key: string = the TBA key of an event.
-metric: string = the TBA/FIRSTApi metric to calculate contribution for.
+metric: string or list<string> = the TBA/FIRSTApi metric(s) to calculate contribution for. 'all' uses every numeric
+score_breakdown field. The system is only built and factored once no matter how many metrics are given.
 exclude_playoffs: boolean = whether to include playoff matches in CC calculations. Default = True
+matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+
+calculate_contribution() and calculate_contributions() parameters:
+solver: string = 'cholesky' to solve the normal equations built from team indices (see solvers.py), or 'lstsq' to solve
+the dense alliances matrix by least squares like earlier versions did. Both give the same contributions up to floating
+point error, but 'cholesky' is much faster for large systems. Default = 'cholesky' (it used to always be 'lstsq')
 
 Returns:
 calculated_contribution: dictionary {team_key: CC, ...} = A dictionary with keys being TBA team_keys and values being the team's CC at the event
+for the first metric
+
+calculate_contributions() returns:
+calculated_contributions: dictionary {team_key: {metric: CC, ...}, ...} = The team's CC at the event for every metric
+Both also keep the solutions (one row per team in team_matrix_map, one column per metric) and the variance of the
+residuals per metric in solutions and residual_variance, which event_simulation uses to predict matches.
+
+calculate_models() parameters:
+models: list<string> = the contribution models to calculate, from 'opr', 'dpr', 'ccwm', 'ridge' and 'mmse' (see
+solvers.py). They all share one eigendecomposition of the normal equations. Default = ['opr', 'dpr', 'ccwm']
+regularization: float = how strongly ridge contributions are shrunk towards 0. Default = 1.0
+noise_ratio: float = the regularization used by mmse. Default = None (estimate it from the event's matches)
+
+calculate_models() returns:
+calculated_models: dictionary {model: {team_key: {metric: CC, ...}, ...}, ...} = The team's CC for every model and metric
 ---------------------------------------------------------------
 """
 
 
 class event_OPR:
-    def __init__(self, authkey, event_key, metric, exclude_playoffs=True):
-        # TBA data handler
-        self.tba = TBA(authkey)
+    def __init__(self, authkey, event_key, metric, exclude_playoffs=True, matches=None):
+        if matches is None:
+            # TBA data handler
+            self.tba = get_tba(authkey)
+            matches = self.tba.event_matches(event=event_key)
 
-        self.matches = get_qualification_matches(
-            self.tba.event_matches(event=event_key)) if exclude_playoffs else self.tba.event_matches(event=event_key)
+        # Every match at the event, including ones that haven't been played yet. Used to simulate the rest of the event
+        self.event_matches = matches
+        self.matches = get_qualification_matches(matches) if exclude_playoffs else matches
 
         # Only keep matches that have been played
         self.matches = get_played_matches(self.matches)
 
         # Which event to calculate contributions for
         self.event_key = event_key
-        # Which metric to calculate contribution by
-        self.metric = metric
+        # Which metrics to calculate contribution by
+        if metric == 'all':
+            self.metrics = get_numeric_fields(self.matches)
+        elif isinstance(metric, str):
+            self.metrics = [metric]
+        else:
+            self.metrics = list(metric)
+        self.metric = self.metrics[0] if len(self.metrics) > 0 else None
 
-        self.team_matrix_map = self.create_team_matrix_map()
-        self.alliances_matrix = self.create_alliances_matrix()
-        self.scores_matrix = self.create_score_matrix()
+        with timer('matrix'):
+            # Column index of every team on every alliance. Used to build both the dense matrix and the normal equations
+            self.team_keys, self.alliance_teams = create_alliance_indices(self.matches)
+
+            self.team_matrix_map = self.create_team_matrix_map()
+            self.scores_matrix = self.create_score_matrix()
+
+        # The dense alliances matrix is only needed by the lstsq solver, so it's built the first time that solver is used
+        self.alliances_matrix = None
+
+        # Cholesky factor and eigendecomposition of the normal equations. Calculated the first time they're needed and
+        # reused for every metric and model
+        self.normal_matrix = None
+        self.normal_factor = None
+        self.normal_decomposition = None
+
+        # The last contributions solved with one row per team and one column per metric, and the variance of the
+        # alliance scores they don't explain per metric (see simulation.py)
+        self.solutions = None
+        self.residual_variance = None
 
     # This function associates each team with a particular column in the alliances matrix
     def create_team_matrix_map(self):
-        team_matrix_position = 0
-        # Keys are the team-key. Value is the team's column index in the matrix
-        team_matrix_map = {}
-        for match in self.matches:
-            for alliance_color in ['blue', 'red']:
-                for team in match['alliances'][alliance_color]['team_keys']:
-                    if team not in team_matrix_map:
-                        team_matrix_map[team] = team_matrix_position
-                        team_matrix_position += 1
-        return team_matrix_map
+        # Keys are the team-key. Value is the team's column index in the matrix. Teams are numbered in the order they
+        # first appear in the matches
+        return {team: team_matrix_position for (team_matrix_position, team) in enumerate(self.team_keys)}
 
     # Initializes a matrix with the total number of matches (multiplied by 2 to account for the two alliances per match)as rows
-    # and the total number of teams present at the event as columns
+    # and the total number of teams present at the event as columns. A team's entry is 1 if they played on that alliance.
+    # Built the first time it's needed
     def create_alliances_matrix(self):
-        alliances_matrix = np.zeros((len(self.matches) * 2, max(self.team_matrix_map.values()) + 1))
-        # Counter to keep track of the row each match corresponds to in the matrix
-        match_position = 0
-        for match in self.matches:
-            # Replaces 0 with 1 in the team's position in the matrix if they played during that match
-            for alliance_color in ['blue', 'red']:
-                for team in match['alliances'][alliance_color]['team_keys']:
-                    alliances_matrix[match_position, self.team_matrix_map[team]] = 1
-                match_position += 1
-        return alliances_matrix
+        if self.alliances_matrix is None:
+            with timer('matrix'):
+                self.alliances_matrix = create_alliances_matrix(self.alliance_teams, len(self.team_keys))
+        return self.alliances_matrix
 
-    # This function creates a 1 column matrix with each row containing the value of the given metric for a particular alliance in a match
+    # This function creates a matrix with each row containing the values of the given metrics for a particular alliance
+    # in a match, with one column per metric
     def create_score_matrix(self):
-        # Creates a matrix equal to the length of all the matches (multiplied by 2 to account for the two alliances)
-        scores_matrix = np.vstack(np.zeros(len(self.matches) * 2))
-        match_position = 0
-        for match in self.matches:
-            for alliance_color in ['blue', 'red']:
-                scores_matrix[match_position] = match['score_breakdown'][alliance_color][self.metric]
-                match_position += 1
-        return scores_matrix
+        return create_alliance_scores(self.matches, self.metrics)
+
+    # This function builds A^T A from the team indices the first time it's needed
+    def create_normal_matrix(self):
+        if self.normal_matrix is None:
+            with timer('matrix'):
+                self.normal_matrix = create_normal_matrix(self.alliance_teams, len(self.team_keys))
+        return self.normal_matrix
+
+    # This function solves the normal equations for every metric at once using the cached Cholesky factor
+    def solve_normal_equations(self):
+        if self.normal_factor is None:
+            with timer('solve'):
+                self.normal_factor = factor_normal_matrix(self.create_normal_matrix())
+        with timer('matrix'):
+            normal_vector = create_normal_vector(self.alliance_teams, len(self.team_keys), self.scores_matrix)
+        with timer('solve'):
+            solutions = solve_normal_equations(self.normal_matrix, normal_vector, self.normal_factor)
+        # Every team's contribution is determined when the normal matrix could be factored
+        self.store_solutions(solutions, rank=len(self.team_keys) if self.normal_factor is not None else None)
+        return solutions
+
+    # This function keeps the solutions and the variance of the residuals they leave, calculating the residuals if the
+    # solver didn't return them
+    def store_solutions(self, solutions, residuals=None, rank=None):
+        if rank is None:
+            rank = np.linalg.matrix_rank(self.create_normal_matrix()) if len(self.team_keys) > 0 else 0
+        self.solutions = solutions
+        self.residual_variance = estimate_residual_variance(self.alliance_teams, self.scores_matrix, solutions, rank,
+                                                            residuals)
+
+    # This function calculates several contribution models for every metric from the cached eigendecomposition of the
+    # normal equations and returns a dictionary of models with dictionaries of team_keys and their CCs per metric
+    def calculate_models(self, models=['opr', 'dpr', 'ccwm'], regularization=1.0, noise_ratio=None):
+        with timer('solve'):
+            if self.normal_decomposition is None:
+                self.normal_decomposition = decompose_normal_matrix(self.create_normal_matrix())
+            model_solutions = calculate_models(self.normal_decomposition, self.alliance_teams, self.scores_matrix,
+                                               models, regularization, noise_ratio)
+
+        return {model: {team: dict(zip(self.metrics, solutions[index]))
+                        for (index, team) in enumerate(self.team_matrix_map)}
+                for (model, solutions) in model_solutions.items()}
+
+    # This function solves the system with the given solver and returns the solutions, one row per team and one column
+    # per metric
+    def solve(self, solver='cholesky'):
+        if solver == 'cholesky':
+            return self.solve_normal_equations()
+        alliances_matrix = self.create_alliances_matrix()
+        with timer('solve'):
+            solutions, residuals, rank, _ = np.linalg.lstsq(alliances_matrix, self.scores_matrix, rcond=None)
+        self.store_solutions(solutions, residuals, rank)
+        return solutions
 
     # This function solves the matrix and returns a dictionary of team_keys and their CCs
-    def calculate_contribution(self):
-        solutions, residuals, _, _ = np.linalg.lstsq(self.alliances_matrix, self.scores_matrix, rcond=None)
+    def calculate_contribution(self, solver='cholesky'):
+        solutions = self.solve(solver)
         # Return the calculated contribution for for the given
 
         calculated_contributions = {}
@@ -90,6 +171,17 @@ class event_OPR:
 
         return calculated_contributions
 
+    # This function solves the matrix for every metric and returns a dictionary of team_keys and their CCs per metric
+    def calculate_contributions(self, solver='cholesky'):
+        solutions = self.solve(solver)
+
+        calculated_contributions = {}
+        # Creates a dictionary with keys being TBA team keys and values being a dictionary of that team's CC per metric
+        for (index, team) in enumerate(self.team_matrix_map):
+            calculated_contributions[team] = dict(zip(self.metrics, solutions[index]))
+
+        return calculated_contributions
+
 
 """
 THE FOLLOWING IS NOT THE CORRECT APPROACH TO CALCULATING OPR. IT IS NOT USED.
@@ -111,7 +203,7 @@ calculated_contribution: float = The calculated contribution of a team to a part
 class team_OPR:
     def __init__(self, authkey, team_key, year, metric, exclude_playoffs=True):
         # TBA data handler
-        self.tba = TBA(authkey)
+        self.tba = get_tba(authkey)
         # Which team to calculate contribution for
         self.team_key = team_key
         # The metric to calculate contribution by
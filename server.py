@@ -0,0 +1,407 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from .utils import get_tba
+from .TBADataHelper import TBADataHelper
+from .instrumentation import record
+
+"""
+Local data service that keeps TBADataHelper results warm in memory and shares them between many clients.
+
+One process holds a single TBADataHelper and answers JSON requests over HTTP, so analysts and dashboards asking for the
+same event don't each fetch its matches and solve its OPRs. Three kinds of values are kept in a memory bounded least
+recently used cache, each tagged with the event it was calculated from:
+- the event's matches
+- the event's event_OPR, which keeps its alliance matrix, Cholesky factor and eigendecomposition between requests
+- the result of every request
+Identical requests that arrive while the first one is still being calculated wait for its result instead of
+calculating it again.
+
+An event's matches are checked against TBA at most once every refresh_interval seconds, when the event is next
+requested. If they've changed (a match was played or a score was corrected), everything calculated from the event is
+dropped. Events can also be invalidated right away by POSTing to /invalidate, either with an event_key query parameter
+or with a TBA webhook message as the body.
+
+Requests are GET /<method>?<parameters>, where method is one of SERVED_METHODS and parameters are the method's
+arguments. Values are read as JSON when they parse (ex. exclude_playoffs=false, fields=["autoPoints","teleopPoints"]),
+otherwise as strings. Repeating a parameter gives a list (ex. calculations=mean&calculations=max), and calculations,
+models and fields are always lists so a single value can be given on its own (ex. calculations=max). GET /stats
+returns the cache's counters.
+
+Usage:
+python -m TBADataHelper.server --authkey ###MY_AUTHKEY### --year 2020 --port 8000
+curl 'http://127.0.0.1:8000/get_event_OPRs?event_key=2020orore'
+
+Parameters:
+--------------------------------------------------------------
+authkey: string = TBA auth key
+year: int = the year passed to TBADataHelper
+max_size: int = the most bytes of matches, solved systems and results to keep. default = 256 MiB
+refresh_interval: float = seconds before an event's matches are checked against TBA again. default = 60
+---------------------------------------------------------------
+"""
+
+# TBADataHelper methods the server answers. Values are (the argument holding the field(s) the method's event_OPR is set
+# up for, the field's default, whether the method takes exclude_playoffs), or None for methods without an event_OPR
+SERVED_METHODS = {
+    'get_event_OPRs': ('field', 'totalPoints', True),
+    'get_event_component_OPRs': ('fields', 'all', True),
+    'get_event_contributions': ('field', 'totalPoints', True),
+    'get_event_predictions': ('field', 'totalPoints', False),
+    'get_event_ranking_forecast': (None, 'totalPoints', False),
+    'get_event_field_statistics': None,
+}
+
+
+# Returns an estimate of the number of bytes a value holds, counting NumPy arrays by their data and objects by their
+# attributes. Values reached more than once are only counted once
+def size_of(value, seen=None):
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if hasattr(value, 'nbytes'):
+        return size + value.nbytes
+    if isinstance(value, dict):
+        return size + sum(size_of(key, seen) + size_of(item, seen) for (key, item) in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return size + sum(size_of(item, seen) for item in value)
+    if hasattr(value, '__dict__'):
+        return size + size_of(vars(value), seen)
+    return size
+
+
+"""
+Least recently used cache of values tagged by event, bounded by their estimated size. Values are calculated by
+get_or_create(), which makes concurrent calls for the same key wait for the first one. Every invalidation of an event
+starts a new generation of it. A value calculated from an older generation than the event's current one isn't stored,
+since it may come from the old matches.
+
+Parameters:
+--------------------------------------------------------------
+max_size: int = the most bytes to keep. The least recently used values are evicted past it
+---------------------------------------------------------------
+"""
+
+
+class memory_cache:
+    def __init__(self, max_size=256 * 1024 * 1024):
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        # Keys are cache keys. Values are (value, size, event_key) tuples, least recently used first
+        self.entries = OrderedDict()
+        # Keys are (cache key, generation) tuples. Values are futures of the values being calculated
+        self.in_flight = {}
+        # Keys are event keys. Values are the number of times the event has been invalidated
+        self.generations = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    # Returns the number of times an event has been invalidated
+    def get_generation(self, event_key):
+        with self.lock:
+            return self.generations.get(event_key, 0)
+
+    # Returns the value stored under key, calculating it with create() if it isn't stored. generation is the event's
+    # generation when the data create() uses was read, which defaults to the current one. Calls only wait for a
+    # calculation of the same generation, so a call made after an invalidation never gets a value from before it
+    def get_or_create(self, key, create, event_key=None, generation=None):
+        with self.lock:
+            if generation is None:
+                generation = self.generations.get(event_key, 0)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                value = self.entries[key][0]
+                found = True
+            else:
+                found = False
+                future = self.in_flight.get((key, generation))
+                first_request = future is None
+                if first_request:
+                    future = self.in_flight[(key, generation)] = Future()
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+        if found:
+            record('memory_cache_hits')
+            return value
+        if not first_request:
+            record('coalesced_requests')
+            return future.result()
+
+        try:
+            value = create()
+        except Exception as error:
+            with self.lock:
+                del self.in_flight[(key, generation)]
+            future.set_exception(error)
+            raise
+
+        # Sized before taking the lock so other requests aren't held up by it
+        size = size_of(value)
+        with self.lock:
+            del self.in_flight[(key, generation)]
+            # The event was invalidated while the value was calculated
+            if self.generations.get(event_key, 0) == generation:
+                self.store(key, value, size, event_key)
+        future.set_result(value)
+        return value
+
+    # Stores a value and evicts the least recently used values until the cache fits in max_size. Called under the lock
+    def store(self, key, value, size, event_key):
+        if size > self.max_size:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size, event_key)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    # Drops every value calculated from an event. Returns the number of values dropped
+    def invalidate(self, event_key):
+        with self.lock:
+            self.generations[event_key] = self.generations.get(event_key, 0) + 1
+            keys = [key for (key, (_, _, entry_event)) in self.entries.items() if entry_event == event_key]
+            for key in keys:
+                self.size -= self.entries.pop(key)[1]
+        return len(keys)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'size': self.size, 'max_size': self.max_size, 'hits': self.hits,
+                    'misses': self.misses, 'coalesced': self.coalesced, 'evictions': self.evictions}
+
+
+"""
+Answers TBADataHelper requests from a memory_cache, keeping every event's matches fresh.
+
+Parameters:
+--------------------------------------------------------------
+authkey: string = TBA auth key
+year: int = the year passed to TBADataHelper
+max_size: int = the most bytes to keep in the cache. default = 256 MiB
+refresh_interval: float = seconds before an event's matches are checked against TBA again. default = 60
+---------------------------------------------------------------
+"""
+
+
+class data_service:
+    def __init__(self, authkey, year, max_size=256 * 1024 * 1024, refresh_interval=60):
+        self.authkey = authkey
+        self.fetcher = TBADataHelper(authkey, year)
+        self.cache = memory_cache(max_size)
+        self.refresh_interval = refresh_interval
+
+        self.lock = threading.Lock()
+        # Keys are event keys. Values are when the event's matches were last fetched from TBA
+        self.checked_times = {}
+
+    # Fetches an event's matches from TBA and notes when they were fetched
+    def fetch_matches(self, event_key):
+        with self.lock:
+            self.checked_times[event_key] = time.monotonic()
+        return get_tba(self.authkey).event_matches(event=event_key)
+
+    # Returns (matches, generation): an event's matches and the event's generation before they were read, which values
+    # calculated from them are stored under. If they haven't been checked against TBA for refresh_interval seconds
+    # they're fetched again, and if they've changed everything calculated from the event is invalidated
+    def get_matches(self, event_key):
+        key = ('matches', event_key)
+        generation = self.cache.get_generation(event_key)
+        matches = self.cache.get_or_create(key, lambda: self.fetch_matches(event_key), event_key, generation)
+
+        # Only one request checks a stale event. The others keep using the cached matches in the meantime
+        with self.lock:
+            stale = time.monotonic() - self.checked_times.get(event_key, 0) >= self.refresh_interval
+            if stale:
+                self.checked_times[event_key] = time.monotonic()
+        if not stale:
+            return matches, generation
+
+        latest_matches = get_tba(self.authkey).event_matches(event=event_key)
+        if latest_matches == matches:
+            return matches, generation
+        # The matches were just checked, so only the cached results are dropped. Invalidating the whole event would make
+        # the next request fetch the matches again
+        self.cache.invalidate(event_key)
+        with self.lock:
+            self.checked_times[event_key] = time.monotonic()
+        generation = self.cache.get_generation(event_key)
+        return self.cache.get_or_create(key, lambda: latest_matches, event_key, generation), generation
+
+    # Returns the event's event_OPR for the given field(s) built from matches, building it the first time
+    def get_opr(self, event_key, metric, exclude_playoffs, matches, generation):
+        from .opr import event_OPR
+
+        key = ('event_OPR', event_key, metric if isinstance(metric, str) else tuple(metric), exclude_playoffs)
+        return self.cache.get_or_create(
+            key, lambda: event_OPR(self.authkey, event_key, metric, exclude_playoffs, matches), event_key, generation)
+
+    # Returns the result of a TBADataHelper method. Results are cached by method and arguments
+    def call(self, method, parameters):
+        if method not in SERVED_METHODS:
+            raise KeyError(f"{method} isn't one of {', '.join(SERVED_METHODS)}")
+        event_key = parameters.get('event_key')
+        if event_key is None:
+            raise ValueError("An event_key is needed to perform this calculation")
+
+        # Checks the event is fresh before looking up results calculated from it. If the event is invalidated while the
+        # result is calculated it isn't stored
+        matches, generation = self.get_matches(event_key)
+        key = ('result', method, json.dumps(parameters, sort_keys=True))
+        return self.cache.get_or_create(key, lambda: self.calculate(method, parameters, matches, generation),
+                                        event_key, generation)
+
+    def calculate(self, method, parameters, matches, generation):
+        arguments = dict(parameters, matches=matches)
+        if SERVED_METHODS[method] is not None:
+            field_argument, default_field, takes_playoffs = SERVED_METHODS[method]
+            metric = parameters.get(field_argument, default_field) if field_argument is not None else default_field
+            # Methods that don't take exclude_playoffs always leave playoffs out
+            exclude_playoffs = parameters.get('exclude_playoffs', True) if takes_playoffs else True
+            arguments['opr'] = self.get_opr(parameters['event_key'], metric, exclude_playoffs, matches, generation)
+        return getattr(self.fetcher, method)(**arguments)
+
+    # Drops the event's matches and everything calculated from them. Returns the number of values dropped
+    def invalidate(self, event_key):
+        with self.lock:
+            self.checked_times.pop(event_key, None)
+        return self.cache.invalidate(event_key)
+
+
+# Returns the event key a TBA webhook message is about, or None if it isn't about an event
+def get_webhook_event_key(message):
+    data = message.get('message_data') or {}
+    match = data.get('match') or {}
+    return data.get('event_key') or match.get('event_key') or \
+        (data['match_key'].split('_')[0] if 'match_key' in data else None)
+
+
+# Arguments that always hold a list. A single value is wrapped in one, except for fields='all'
+LIST_PARAMETERS = {'calculations', 'models', 'fields'}
+
+
+# Turns a query string into method arguments. Values are read as JSON when they parse and repeated keys become lists
+def parse_parameters(query):
+    parameters = {}
+    for (name, values) in parse_qs(query, keep_blank_values=True).items():
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(json.loads(value))
+            except ValueError:
+                parsed.append(value)
+        parameters[name] = parsed[0] if len(parsed) == 1 else parsed
+        if name in LIST_PARAMETERS and not isinstance(parameters[name], list) and parameters[name] != 'all':
+            parameters[name] = [parameters[name]]
+    return parameters
+
+
+# Writes NumPy numbers as plain JSON numbers
+def to_json(value):
+    return json.dumps(value, default=lambda item: item.item() if hasattr(item, 'item') else str(item))
+
+
+class request_handler(BaseHTTPRequestHandler):
+    # Set on the handler class made by create_server()
+    service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        method = url.path.strip('/')
+        if method == 'stats':
+            return self.send_json(200, self.service.cache.stats())
+        if method not in SERVED_METHODS:
+            return self.send_json(404, {'error': f"Unknown method {method}"})
+
+        try:
+            parameters = parse_parameters(url.query)
+            result = self.service.call(method, parameters)
+        except (KeyError, ValueError, TypeError) as error:
+            return self.send_json(400, {'error': repr(error)})
+        except Exception as error:
+            return self.send_json(500, {'error': repr(error)})
+        if result is None:
+            return self.send_json(400, {'error': f"{method} couldn't be calculated with {parameters}"})
+        self.send_json(200, result)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.strip('/') != 'invalidate':
+            return self.send_json(404, {'error': f"Unknown path {url.path}"})
+
+        event_key = parse_parameters(url.query).get('event_key')
+        if event_key is None:
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                event_key = get_webhook_event_key(json.loads(body)) if body else None
+            except (ValueError, AttributeError) as error:
+                return self.send_json(400, {'error': repr(error)})
+        if event_key is None:
+            return self.send_json(400, {'error': "An event_key is needed to invalidate an event"})
+        self.send_json(200, {'event_key': event_key, 'invalidated': self.service.invalidate(event_key)})
+
+    def send_json(self, status, value):
+        body = to_json(value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests aren't logged to stderr
+    def log_message(self, format, *args):
+        pass
+
+
+# Returns a ThreadingHTTPServer answering requests from a data_service. Port 0 picks a free port, which can be read
+# from server.server_address. Call serve_forever() on it to start answering requests
+def create_server(authkey, year, host='127.0.0.1', port=8000, max_size=256 * 1024 * 1024, refresh_interval=60):
+    service = data_service(authkey, year, max_size, refresh_interval)
+    handler = type('service_request_handler', (request_handler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve TBADataHelper results from a warm in-memory cache')
+    parser.add_argument('--authkey', required=True, help='TBA auth key')
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-size', type=int, default=256, help='MiB of matches and results to keep in memory')
+    parser.add_argument('--refresh-interval', type=float, default=60,
+                        help='seconds before an event is checked against TBA again')
+    args = parser.parse_args()
+
+    server = create_server(args.authkey, args.year, args.host, args.port, args.max_size * 1024 * 1024,
+                           args.refresh_interval)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
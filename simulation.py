@@ -0,0 +1,240 @@
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from .utils import *
+from .solvers import predict_alliance_scores
+from .opr import event_OPR
+from .instrumentation import timer
+
+"""
+Predicts qualification matches and simulates an event's rankings from the contributions (CC) event_OPR solves.
+
+An alliance's expected score is the sum of its teams' contributions, and its actual score is modeled as the expected
+score plus normally distributed noise with the variance of event_OPR's residuals. That gives every match:
+- the expected score of each alliance
+- the probability blue wins, from the difference of two independent normal scores
+
+Rankings are simulated by replaying every unplayed qualification match many times. Played matches keep their real
+scores. Each batch of replays is a few NumPy operations over a (replays, matches, alliances) array of scores, and
+batches can be spread over worker processes. Teams are ranked by ranking points per match (a win is worth win_points
+and a tie tie_points) with ties broken by average score. Year specific bonus ranking points aren't simulated, and
+surrogate appearances don't count towards a team's ranking.
+
+Parameters:
+--------------------------------------------------------------
+event_key: string = the TBA key of an event.
+metric: string = the TBA/FIRSTApi metric to predict. Should be the alliance score (ex. totalPoints) for simulated
+rankings to be meaningful. default='totalPoints'
+matches: list = the event's matches if they've already been fetched. default=None (fetch them from TBA)
+opr: event_OPR = contributions that have already been calculated for the event. default=None (calculate them)
+
+predict() parameters:
+schedule: list = matches in the layout TBA uses or [[blue team keys], [red team keys]] pairs. Teams that haven't
+played yet are expected to score the average contribution
+
+predict() returns:
+expected_scores: np.ndarray = the expected score of every alliance, shape (matches, 2) with blue first
+blue_win_probabilities: np.ndarray = the probability blue wins every match, shape (matches,)
+
+simulate_rankings() parameters:
+simulations: int = the number of times the rest of the event is replayed. default=10000
+seed: int = seeds the random numbers so the simulation can be repeated exactly. default=None
+workers: int = the number of processes the replays are split over. None uses one per CPU, 0 runs them in this
+process. The processes are spawned, so scripts using them need their code under if __name__ == '__main__'. default=0
+batch_size: int = the number of replays simulated at once. Bounds the memory used. default=1000
+
+Returns:
+rankings: dictionary = Keys are team keys with values being {mean_rank, mean_ranking_points, rank_probabilities}
+where rank_probabilities[i] is the probability the team finishes ranked i + 1
+---------------------------------------------------------------
+"""
+
+
+# Given a schedule of matches (in the layout TBA uses) or [[blue team keys], [red team keys]] pairs, returns the team
+# keys in the schedule (the teams in team_matrix_map first, in their column order), an int array of shape
+# (matches, 2, teams per alliance) holding each team's index in the team keys, padded with -1, and a boolean array of
+# the same shape that's set where a team is playing as a surrogate
+def create_schedule_indices(team_matrix_map, schedule):
+    team_ids = dict(team_matrix_map)
+    alliance_teams = []
+    alliance_surrogates = []
+    for match in schedule:
+        for (alliance, alliance_color) in enumerate(['blue', 'red']):
+            if isinstance(match, dict):
+                team_keys = match['alliances'][alliance_color]['team_keys']
+                surrogate_keys = match['alliances'][alliance_color].get('surrogate_team_keys') or []
+            else:
+                team_keys, surrogate_keys = match[alliance], []
+            alliance_teams.append([team_ids.setdefault(team, len(team_ids)) for team in team_keys])
+            alliance_surrogates.append([team in surrogate_keys for team in team_keys])
+
+    width = max((len(teams) for teams in alliance_teams), default=0)
+    schedule_teams = np.full((len(alliance_teams), width), -1, dtype=np.intp)
+    surrogates = np.zeros((len(alliance_teams), width), dtype=bool)
+    for (row, teams) in enumerate(alliance_teams):
+        schedule_teams[row, :len(teams)] = teams
+        surrogates[row, :len(teams)] = alliance_surrogates[row]
+    return list(team_ids), schedule_teams.reshape(-1, 2, width), surrogates.reshape(-1, 2, width)
+
+
+# Returns the expected score of every alliance in a schedule, shape (matches, 2), from each team's contribution
+def predict_schedule(schedule_teams, contributions):
+    alliance_teams = schedule_teams.reshape(-1, schedule_teams.shape[2])
+    return predict_alliance_scores(alliance_teams, contributions[:, np.newaxis])[:, 0].reshape(-1, 2)
+
+
+# Coefficients of the Abramowitz & Stegun 7.1.26 approximation of erf, which is within 1.5e-7 of it everywhere
+ERF_P = 0.3275911
+ERF_COEFFICIENTS = [1.061405429, -1.453152027, 1.421413741, -0.284496736, 0.254829592]
+
+
+# Returns the standard normal CDF of every value in an array at once
+def normal_cdf(values):
+    values = np.asarray(values, dtype=float)
+    distances = np.abs(values) / math.sqrt(2)
+    t = 1 / (1 + ERF_P * distances)
+    polynomial = np.zeros_like(t)
+    for coefficient in ERF_COEFFICIENTS:
+        polynomial = (polynomial + coefficient) * t
+    erf = 1 - polynomial * np.exp(-distances ** 2)
+    return 0.5 * (1 + np.sign(values) * erf)
+
+
+# Returns the probability blue outscores red in every match when each alliance's score is normally distributed around
+# its expected score with the given standard deviation
+def win_probabilities(expected_scores, deviation):
+    margins = expected_scores[:, 0] - expected_scores[:, 1]
+    if deviation <= 0:
+        return np.where(margins > 0, 1.0, np.where(margins < 0, 0.0, 0.5))
+    # The difference of the two scores has a standard deviation of sqrt(2) * deviation
+    return normal_cdf(margins / (math.sqrt(2) * deviation))
+
+
+# Replays the unplayed matches simulations times and ranks the teams after each replay. Only takes arrays so it can be
+# sent to a worker process. Returns (rank_counts, ranking_points) where rank_counts[team, rank] is the number of
+# replays the team finished at rank (0 being first) and ranking_points is every team's total over all of the replays
+def simulate_ranking_batch(schedule_teams, surrogates, expected_scores, played_scores, played, deviation, team_count,
+                           simulations, seed=None, win_points=2, tie_points=1):
+    random = np.random.default_rng(seed)
+    scores = expected_scores + deviation * random.standard_normal((simulations,) + expected_scores.shape)
+    scores[:, played] = played_scores[played]
+
+    # Ranking points earned by each alliance, shape (simulations, matches, 2)
+    margins = scores[:, :, 0] - scores[:, :, 1]
+    alliance_points = np.stack([np.where(margins > 0, win_points, np.where(margins == 0, tie_points, 0)),
+                                np.where(margins < 0, win_points, np.where(margins == 0, tie_points, 0))], axis=2)
+
+    # Every counted (match, alliance, team) appearance. Replays are offset by team_count so one bincount adds up every
+    # team in every replay
+    matches, alliances, stations = np.nonzero((schedule_teams >= 0) & ~surrogates)
+    teams = schedule_teams[matches, alliances, stations]
+    team_indices = (np.arange(simulations)[:, np.newaxis] * team_count + teams).ravel()
+    team_points = np.bincount(team_indices, weights=alliance_points[:, matches, alliances].ravel(),
+                              minlength=simulations * team_count).reshape(simulations, team_count)
+    team_scores = np.bincount(team_indices, weights=scores[:, matches, alliances].ravel(),
+                              minlength=simulations * team_count).reshape(simulations, team_count)
+    matches_played = np.maximum(np.bincount(teams, minlength=team_count), 1)
+
+    # Sort every replay by ranking points per match, then average score. The last key is sorted on first
+    order = np.lexsort((-team_scores / matches_played, -team_points / matches_played), axis=-1)
+    rank_counts = np.bincount((order * team_count + np.arange(team_count)).ravel(),
+                              minlength=team_count * team_count).reshape(team_count, team_count)
+    return rank_counts, team_points.sum(axis=0)
+
+
+# Splits the replays into batches and simulates them in this process (workers=0) or a pool of worker processes. The
+# workers are spawned rather than forked, since the caller may have threads running (ex. server.py) whose locks a
+# forked worker could inherit and deadlock on. Every batch gets its own random stream spawned from the seed, so results only depend on the seed and batch_size.
+# Returns the summed (rank_counts, ranking_points) of simulate_ranking_batch
+def simulate_rankings(schedule_teams, surrogates, expected_scores, played_scores, played, deviation, team_count,
+                      simulations=10000, seed=None, workers=0, batch_size=1000, win_points=2, tie_points=1):
+    batch_sizes = [min(batch_size, simulations - start) for start in range(0, simulations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    arguments = [(schedule_teams, surrogates, expected_scores, played_scores, played, deviation, team_count, size,
+                  batch_seed, win_points, tie_points) for (size, batch_seed) in zip(batch_sizes, seeds)]
+
+    if workers == 0:
+        results = [simulate_ranking_batch(*batch_arguments) for batch_arguments in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as process_pool:
+            results = list(process_pool.map(simulate_ranking_batch, *zip(*arguments)))
+
+    rank_counts = np.zeros((team_count, team_count), dtype=np.int64)
+    ranking_points = np.zeros(team_count)
+    for (batch_rank_counts, batch_ranking_points) in results:
+        rank_counts += batch_rank_counts
+        ranking_points += batch_ranking_points
+    return rank_counts, ranking_points
+
+
+class event_simulation:
+    def __init__(self, authkey, event_key, metric='totalPoints', matches=None, opr=None):
+        # Which event to simulate
+        self.event_key = event_key
+        self.opr = opr if opr is not None else event_OPR(authkey, event_key, metric, matches=matches)
+        self.metric = self.opr.metric
+        if self.opr.solutions is None and len(self.opr.team_keys) > 0:
+            self.opr.calculate_contributions()
+
+        # Every qualification match in the order they're played, including the ones that haven't been played yet
+        self.schedule = sorted(get_qualification_matches(self.opr.event_matches), key=lambda match: match['match_number'])
+
+        with timer('simulate'):
+            self.team_keys, self.schedule_teams, self.surrogates = create_schedule_indices(self.opr.team_matrix_map,
+                                                                                           self.schedule)
+            self.contributions = self.create_contributions(len(self.team_keys))
+            self.expected_scores = predict_schedule(self.schedule_teams, self.contributions)
+
+            # Real scores of the matches that have been played, NaN for the rest
+            self.played = np.array([match['score_breakdown'] is not None for match in self.schedule], dtype=bool)
+            self.played_scores = np.array([[match['score_breakdown'][alliance_color][self.metric]
+                                            if match['score_breakdown'] is not None else np.nan
+                                            for alliance_color in ['blue', 'red']] for match in self.schedule],
+                                          dtype=float).reshape(-1, 2)
+
+    # Returns every team's contribution to the metric. Teams that haven't played yet get the average contribution.
+    # Before any match has been played every team is expected to score the same
+    def create_contributions(self, team_count):
+        if self.opr.solutions is None:
+            self.deviation = 1.0
+            self.average_contribution = 0.0
+            return np.zeros(team_count)
+        self.deviation = math.sqrt(self.opr.residual_variance[0])
+        solved = self.opr.solutions[:, 0]
+        self.average_contribution = solved.mean()
+        return np.r_[solved, np.full(team_count - len(solved), self.average_contribution)]
+
+    # This function returns the expected scores and blue's win probability for an arbitrary schedule
+    def predict(self, schedule):
+        with timer('simulate'):
+            # Teams that aren't at the event are numbered after the event's teams
+            team_keys, schedule_teams, _ = create_schedule_indices(
+                {team: index for (index, team) in enumerate(self.team_keys)}, schedule)
+            contributions = np.r_[self.contributions,
+                                  np.full(len(team_keys) - len(self.team_keys), self.average_contribution)]
+            expected_scores = predict_schedule(schedule_teams, contributions)
+            return expected_scores, win_probabilities(expected_scores, self.deviation)
+
+    # This function returns a dictionary of match keys with each alliance's expected score and blue's win probability
+    # for every qualification match at the event
+    def predict_matches(self):
+        with timer('simulate'):
+            probabilities = win_probabilities(self.expected_scores, self.deviation)
+        return {match['key']: {'blue': self.expected_scores[row, 0], 'red': self.expected_scores[row, 1],
+                               'blue_win_probability': probabilities[row]}
+                for (row, match) in enumerate(self.schedule)}
+
+    # This function replays the rest of the event and returns a dictionary of team_keys and their ranking forecasts
+    def simulate_rankings(self, simulations=10000, seed=None, workers=0, batch_size=1000, win_points=2, tie_points=1):
+        team_count = len(self.team_keys)
+        with timer('simulate'):
+            rank_counts, ranking_points = simulate_rankings(self.schedule_teams, self.surrogates, self.expected_scores,
+                                                            self.played_scores, self.played, self.deviation, team_count,
+                                                            simulations, seed, workers, batch_size, win_points,
+                                                            tie_points)
+        rank_probabilities = rank_counts / max(simulations, 1)
+        mean_ranks = rank_probabilities @ np.arange(1, team_count + 1)
+        return {team: {'mean_rank': mean_ranks[index], 'mean_ranking_points': ranking_points[index] / max(simulations, 1),
+                       'rank_probabilities': rank_probabilities[index].tolist()}
+                for (index, team) in enumerate(self.team_keys)}
@@ -0,0 +1,146 @@
+import json
+import os
+import numpy as np
+from tbapy.models import Event, Match, Team
+from .utils import *
+from .match_table import *
+from .instrumentation import timer
+
+"""
+Offline snapshots of a season's matches.
+
+A snapshot stores the columns of a MatchTable (see match_table.py) along with its team, event and text string tables
+and a small JSON manifest. It can be written two ways:
+- a single compressed .npz file, which is the smallest to copy around
+- a directory of .npy files, which is memory-mapped when loaded so a whole season is ready without reading it all
+
+install_snapshot() puts a snapshot_TBA underneath every TBA request made by the package, so TBADataHelper, event_OPR
+and get_field_statistic work without any network access. snapshot_TBA answers the requests the package makes
+(events, event_matches, event_teams, team_events, team_matches) from the stored matches. Teams are only known to be
+at an event if they played a match there.
+
+Usage:
+dump_season('###MY_AUTHKEY###', 2020, 'season_2020.npz')
+install_snapshot('season_2020.npz')
+"""
+
+# Prefixes of the array names holding score_breakdown columns
+NUMERIC_PREFIX = 'numeric__'
+CATEGORICAL_PREFIX = 'categorical__'
+
+
+# Writes a MatchTable to path. Paths ending in .npz are written as a single file, anything else as a directory of
+# memory-mappable .npy files. event_keys can list events without any matches so they're kept in the snapshot
+def save_snapshot(path, table, year=None, event_keys=None, compressed=True):
+    arrays = {column: getattr(table, column) for column in MATCH_COLUMNS}
+    arrays['team_keys'] = np.array(table.team_keys, dtype=str)
+    arrays['event_keys'] = np.array(table.event_keys, dtype=str)
+    arrays['strings'] = np.array(table.strings, dtype=str)
+    for (field, column) in table.numeric_fields.items():
+        arrays[NUMERIC_PREFIX + field] = column
+    for (field, column) in table.categorical_fields.items():
+        arrays[CATEGORICAL_PREFIX + field] = column
+
+    manifest = {'year': year, 'field_types': table.field_types,
+                'season_event_keys': list(event_keys) if event_keys is not None else list(table.event_keys)}
+    arrays['manifest'] = np.array(json.dumps(manifest))
+
+    if path.endswith('.npz'):
+        (np.savez_compressed if compressed else np.savez)(path, **arrays)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for (name, array) in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+
+# Reads a snapshot written by save_snapshot. Returns the MatchTable and the manifest
+# ({'year': int, 'field_types': {...}, 'season_event_keys': [...]})
+def load_snapshot(path, mmap=True):
+    if path.endswith('.npz'):
+        with np.load(path) as snapshot:
+            arrays = {name: snapshot[name] for name in snapshot.files}
+    else:
+        arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+                  for name in os.listdir(path) if name.endswith('.npy')}
+
+    manifest = json.loads(str(arrays['manifest']))
+    table = MatchTable.from_columns(
+        arrays, arrays['team_keys'].tolist(), arrays['event_keys'].tolist(), arrays['strings'].tolist(),
+        {name[len(NUMERIC_PREFIX):]: array for (name, array) in arrays.items() if name.startswith(NUMERIC_PREFIX)},
+        {name[len(CATEGORICAL_PREFIX):]: array for (name, array) in arrays.items()
+         if name.startswith(CATEGORICAL_PREFIX)},
+        manifest['field_types'])
+    return table, manifest
+
+
+# Fetches every match of a season from TBA and writes it to a snapshot
+def dump_season(authkey, year, path, fetch_workers=8, compressed=True):
+    event_keys = get_tba(authkey).events(year, keys=True)
+    table = load_match_table(authkey, event_keys=event_keys, fetch_workers=fetch_workers)
+    save_snapshot(path, table, year, event_keys, compressed)
+    return table
+
+
+"""
+TBA data handler that answers requests from a snapshot instead of the TBA API.
+
+Parameters:
+--------------------------------------------------------------
+table: MatchTable = the matches to answer requests from
+manifest: dictionary = the manifest returned by load_snapshot. default=None
+---------------------------------------------------------------
+"""
+
+
+class snapshot_TBA:
+    def __init__(self, table, manifest=None):
+        self.table = table
+        self.season_event_keys = (manifest or {}).get('season_event_keys') or list(table.event_keys)
+
+    @staticmethod
+    def team_key(identifier):
+        return identifier if type(identifier) == str else 'frc%s' % identifier
+
+    # Returns the matches in the mask as tbapy Match objects
+    def get_matches(self, mask, keys=False):
+        rows = np.flatnonzero(mask)
+        if keys:
+            return [str(self.table.match_keys[row]) for row in rows]
+        with timer('parse'):
+            return [Match(self.table.get_match(row)) for row in rows]
+
+    # Returns the keys of the events in the mask's matches, in the order they were stored
+    def get_event_keys(self, mask):
+        return [self.table.event_keys[event] for event in np.unique(self.table.match_events[mask])]
+
+    def events(self, year, simple=False, keys=False):
+        event_keys = [event for event in self.season_event_keys if event[:4] == str(year)]
+        return event_keys if keys else [Event({'key': event, 'year': int(event[:4])}) for event in event_keys]
+
+    def event_matches(self, event, simple=False, keys=False):
+        return self.get_matches(self.table.mask(event_key=event), keys)
+
+    def event_teams(self, event, simple=False, keys=False):
+        team_ids = np.unique(self.table.alliance_teams[self.table.mask(event_key=event)])
+        team_keys = [self.table.team_keys[team] for team in team_ids if team >= 0]
+        return team_keys if keys else [Team({'key': team, 'team_number': int(team[3:])}) for team in team_keys]
+
+    def team_events(self, team, year=None, simple=False, keys=False):
+        event_keys = self.get_event_keys(self.table.mask(team_key=self.team_key(team)))
+        if year:
+            event_keys = [event for event in event_keys if event[:4] == str(year)]
+        return event_keys if keys else [Event({'key': event, 'year': int(event[:4])}) for event in event_keys]
+
+    def team_matches(self, team, event=None, year=None, simple=False, keys=False):
+        mask = self.table.mask(team_key=self.team_key(team), event_key=event)
+        if year and not event:
+            in_year = np.array([event_key[:4] == str(year) for event_key in self.table.event_keys], dtype=bool)
+            mask &= in_year[self.table.match_events]
+        return self.get_matches(mask, keys)
+
+
+# Loads a snapshot and puts it underneath every TBA request made by the package. Returns the snapshot's MatchTable
+def install_snapshot(path, mmap=True):
+    table, manifest = load_snapshot(path, mmap)
+    set_tba_factory(lambda authkey: snapshot_TBA(table, manifest))
+    return table
@@ -0,0 +1,307 @@
+import numpy as np
+
+"""
+Vectorized contribution (CC) solver that works from team index arrays instead of a dense alliances matrix.
+
+Every alliance in every match is a row of the system. Rather than building the (alliances x teams) matrix A, the
+small (teams x teams) normal equations A^T A x = A^T b are accumulated straight from the team indices of each row
+and solved with a Cholesky factorization. Several metrics can be solved at once by stacking their scores as columns
+of b, which lets one factorization serve all of them. This keeps whole-season systems with thousands of teams and
+tens of thousands of rows cheap to build and solve.
+"""
+
+# Diagonal entries of the Cholesky factor smaller than this (relative to the largest one) mean the system doesn't
+# determine every team's contribution, ex.) early in an event. Those systems are solved by least squares instead
+CHOLESKY_TOLERANCE = 1e-6
+
+# Eigenvalues of the normal matrix smaller than this (relative to the largest one) are treated as 0
+EIGENVALUE_TOLERANCE = 1e-10
+
+# Contribution models calculated by calculate_models():
+# - opr: contribution to the alliance's own score
+# - dpr: contribution to the opposing alliance's score
+# - ccwm: contribution to the winning margin, which is opr - dpr
+# - ridge: opr shrunk towards 0 by the regularization
+# - mmse: opr shrunk towards the average contribution by the ratio of noise to the spread between teams
+MODELS = ['opr', 'dpr', 'ccwm', 'ridge', 'mmse']
+
+
+# Given a list of matches, returns the list of team keys in the order they first appear and an int array with a row
+# for every alliance (blue then red for each match) holding the column index of each team on it. Alliances with fewer
+# teams than the largest alliance are padded with -1
+def create_alliance_indices(matches):
+    team_keys = []
+    alliance_sizes = []
+    for match in matches:
+        for alliance_color in ['blue', 'red']:
+            alliance = match['alliances'][alliance_color]['team_keys']
+            team_keys.extend(alliance)
+            alliance_sizes.append(len(alliance))
+
+    if len(team_keys) == 0:
+        return [], np.zeros((len(alliance_sizes), 0), dtype=np.intp)
+
+    # Number teams in the order they first appear so columns line up with event_OPR's team_matrix_map
+    unique_keys, first_appearance, team_columns = np.unique(np.array(team_keys), return_index=True,
+                                                            return_inverse=True)
+    appearance_order = np.argsort(first_appearance)
+    column_of_unique = np.empty_like(appearance_order)
+    column_of_unique[appearance_order] = np.arange(len(appearance_order))
+    team_columns = column_of_unique[team_columns.ravel()]
+
+    alliance_sizes = np.array(alliance_sizes)
+    alliance_teams = np.full((len(alliance_sizes), alliance_sizes.max()), -1, dtype=np.intp)
+    rows = np.repeat(np.arange(len(alliance_sizes)), alliance_sizes)
+    # Position of each team within its alliance
+    positions = np.arange(len(team_columns)) - np.repeat(np.cumsum(alliance_sizes) - alliance_sizes, alliance_sizes)
+    alliance_teams[rows, positions] = team_columns
+
+    return [str(team) for team in unique_keys[appearance_order]], alliance_teams
+
+
+# Returns an array with a row for every alliance (blue then red for each match) and a column for each metric. With no
+# metrics (ex. 'all' before any match has been played) the array has no columns
+def create_alliance_scores(matches, metrics):
+    if len(metrics) == 0:
+        return np.zeros((len(matches) * 2, 0))
+    return np.array([[match['score_breakdown'][alliance_color][metric] for metric in metrics]
+                     for match in matches for alliance_color in ['blue', 'red']], dtype=float).reshape(-1, len(metrics))
+
+
+# Returns the score_breakdown fields that hold a number for every alliance in the matches, in the order TBA lists them
+def get_numeric_fields(matches):
+    numeric_fields = None
+    for match in matches:
+        for alliance_color in ['blue', 'red']:
+            breakdown = match['score_breakdown'][alliance_color]
+            # Booleans are ints in Python but aren't scores
+            fields = [field for (field, value) in breakdown.items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            numeric_fields = fields if numeric_fields is None else [field for field in numeric_fields if field in fields]
+    return numeric_fields if numeric_fields is not None else []
+
+
+# Builds the dense alliances matrix A from the alliance team indices
+def create_alliances_matrix(alliance_teams, team_count):
+    alliances_matrix = np.zeros((alliance_teams.shape[0], team_count))
+    rows, positions = np.nonzero(alliance_teams >= 0)
+    alliances_matrix[rows, alliance_teams[rows, positions]] = 1
+    return alliances_matrix
+
+
+# Returns A^T A, where entry (i, j) is the number of alliances teams i and j were both on
+def create_normal_matrix(alliance_teams, team_count):
+    first_teams = np.repeat(alliance_teams[:, :, np.newaxis], alliance_teams.shape[1], axis=2)
+    second_teams = np.repeat(alliance_teams[:, np.newaxis, :], alliance_teams.shape[1], axis=1)
+    both_present = (first_teams >= 0) & (second_teams >= 0)
+    pair_indices = first_teams[both_present] * team_count + second_teams[both_present]
+    return np.bincount(pair_indices, minlength=team_count * team_count).reshape(team_count, team_count).astype(float)
+
+
+# Returns A^T b, where row i holds the sum of every score of every alliance team i was on
+def create_normal_vector(alliance_teams, team_count, alliance_scores):
+    rows, positions = np.nonzero(alliance_teams >= 0)
+    teams = alliance_teams[rows, positions]
+    normal_vector = np.zeros((team_count, alliance_scores.shape[1]))
+    for column in range(alliance_scores.shape[1]):
+        normal_vector[:, column] = np.bincount(teams, weights=alliance_scores[rows, column], minlength=team_count)
+    return normal_vector
+
+
+# Returns the lower triangular Cholesky factor of the normal matrix, or None if the normal matrix is singular
+def factor_normal_matrix(normal_matrix):
+    try:
+        factor = np.linalg.cholesky(normal_matrix)
+    except np.linalg.LinAlgError:
+        return None
+    diagonal = np.diag(factor)
+    if len(diagonal) == 0 or diagonal.min() <= CHOLESKY_TOLERANCE * diagonal.max():
+        return None
+    return factor
+
+
+# Updates the lower triangular Cholesky factor L of a matrix M in place so that it becomes the factor of M + x x^T.
+# Entries of x before start must be 0, which lets updates for a single alliance skip the teams before its first team
+def cholesky_update(factor, vector, start=0):
+    vector = np.array(vector, dtype=float)
+    for k in range(start, len(vector)):
+        if vector[k] == 0:
+            continue
+        radius = np.hypot(factor[k, k], vector[k])
+        cosine = radius / factor[k, k]
+        sine = vector[k] / factor[k, k]
+        factor[k, k] = radius
+        factor[k + 1:, k] = (factor[k + 1:, k] + sine * vector[k + 1:]) / cosine
+        vector[k + 1:] = cosine * vector[k + 1:] - sine * factor[k + 1:, k]
+    return factor
+
+
+# Rows of x solved together by triangular_solve. Each block's own triangle is small enough that solving it directly is
+# cheaper than looping over its rows in Python
+TRIANGULAR_BLOCK_SIZE = 32
+
+
+# Solves T x = b for a triangular matrix T by substitution, a block of rows of x at a time starting from the first row
+# (lower) or the last row (upper). Every block only needs the rows of x already solved, so the whole solve takes
+# O(n^2) per column of b instead of the O(n^3) of a general solve
+def triangular_solve(triangle, vector, lower=True):
+    size = len(triangle)
+    solution = np.zeros(np.shape(vector))
+    starts = range(0, size, TRIANGULAR_BLOCK_SIZE)
+    for start in starts if lower else reversed(starts):
+        end = min(start + TRIANGULAR_BLOCK_SIZE, size)
+        known = triangle[start:end, :start] @ solution[:start] if lower else \
+            triangle[start:end, end:] @ solution[end:]
+        solution[start:end] = np.linalg.solve(triangle[start:end, start:end], vector[start:end] - known)
+    return solution
+
+
+# Solves L L^T x = b given the lower triangular Cholesky factor L, with a forward substitution for L y = b and a back
+# substitution for L^T x = y
+def cholesky_solve(factor, normal_vector):
+    return triangular_solve(factor.T, triangular_solve(factor, normal_vector), lower=False)
+
+
+# Solves (L L^T - regularization * I) x = b given the Cholesky factor L of a matrix with regularization added to its
+# diagonal, which removes the bias the regularization adds to the solution. Starts from the regularized solution and
+# refines it with x += (L L^T)^-1 (b - (L L^T - regularization * I) x), which takes O(n^2) per iteration. Every direction
+# the matrix determines converges by a factor of regularization / (eigenvalue + regularization) per iteration, while
+# directions it doesn't determine stay at 0, so a singular matrix gives the minimum norm solution like np.linalg.lstsq
+def regularized_cholesky_solve(factor, normal_vector, regularization, tolerance=1e-12, max_iterations=100):
+    solution = cholesky_solve(factor, normal_vector)
+    if regularization == 0:
+        return solution
+    for _ in range(max_iterations):
+        residual = normal_vector - (factor @ (factor.T @ solution) - regularization * solution)
+        correction = cholesky_solve(factor, residual)
+        solution += correction
+        if np.abs(correction).max(initial=0) <= tolerance * max(np.abs(solution).max(initial=0), 1):
+            break
+    return solution
+
+
+# Solves the normal equations for every column of normal_vector. If the normal matrix couldn't be factored, the
+# minimum norm least squares solution is returned, which is the same solution np.linalg.lstsq gives for A x = b
+def solve_normal_equations(normal_matrix, normal_vector, factor=None):
+    if factor is None:
+        factor = factor_normal_matrix(normal_matrix)
+    if factor is None:
+        return np.linalg.lstsq(normal_matrix, normal_vector, rcond=None)[0]
+    return cholesky_solve(factor, normal_vector)
+
+
+# Returns the eigendecomposition (eigenvalues, eigenvectors) of the normal matrix. Once it's calculated the normal
+# equations can be solved with any amount of regularization for the cost of a few matrix products
+def decompose_normal_matrix(normal_matrix):
+    return np.linalg.eigh(normal_matrix)
+
+
+# Solves (A^T A + regularization * I) x = A^T b + regularization * prior for every column of normal_vector given the
+# eigendecomposition of A^T A. regularization and prior can hold a value per column. Without regularization the
+# contributions the matches don't determine are left out, which gives the same solution as np.linalg.lstsq
+def eigen_solve(decomposition, normal_vector, regularization=0.0, prior=0.0):
+    eigenvalues, eigenvectors = decomposition
+    regularization = np.asarray(regularization, dtype=float)
+    shifted = eigenvalues[:, np.newaxis] + regularization
+    inverse = np.zeros_like(shifted)
+    determined = shifted > EIGENVALUE_TOLERANCE * eigenvalues.max(initial=0)
+    inverse[determined] = 1 / shifted[determined]
+    return eigenvectors @ (inverse * (eigenvectors.T @ (normal_vector + regularization * prior)))
+
+
+# Returns each alliance's score predicted by adding up the contributions of its teams
+def predict_alliance_scores(alliance_teams, solutions):
+    present = alliance_teams >= 0
+    return np.where(present[:, :, np.newaxis], solutions[alliance_teams], 0).sum(axis=1)
+
+
+# Estimates the variance of the difference between every alliance's score and the score its teams' contributions
+# predict, for every column of alliance_scores. residuals are the sums of squared residuals from np.linalg.lstsq if it
+# returned them. Systems with no more alliances than determined contributions have no residuals to estimate from, so
+# the variance of the alliance scores themselves is used instead
+def estimate_residual_variance(alliance_teams, alliance_scores, solutions, rank, residuals=None):
+    degrees_of_freedom = len(alliance_scores) - rank
+    if degrees_of_freedom <= 0:
+        return alliance_scores.var(axis=0) if len(alliance_scores) > 0 else np.zeros(alliance_scores.shape[1])
+    if residuals is None or len(residuals) == 0:
+        residuals = ((alliance_scores - predict_alliance_scores(alliance_teams, solutions)) ** 2).sum(axis=0)
+    return residuals / degrees_of_freedom
+
+
+# Estimates the ratio of the noise in alliance scores to the spread of contributions between teams for every column of
+# alliance_scores. Used as the regularization, it makes ridge regression towards the average contribution the minimum
+# mean squared error (MMSE) estimate. Columns without enough matches to estimate the noise get a ratio of 1
+def estimate_noise_ratio(decomposition, alliance_teams, alliance_scores, solutions):
+    eigenvalues = decomposition[0]
+    rank = np.count_nonzero(eigenvalues > EIGENVALUE_TOLERANCE * eigenvalues.max(initial=0))
+    degrees_of_freedom = len(alliance_scores) - rank
+    if degrees_of_freedom <= 0:
+        return np.ones(alliance_scores.shape[1])
+
+    residuals = alliance_scores - predict_alliance_scores(alliance_teams, solutions)
+    noise_variance = (residuals ** 2).sum(axis=0) / degrees_of_freedom
+    # Each alliance score adds up the contributions of every team on it along with the noise
+    alliance_size = (alliance_teams >= 0).sum(axis=1).mean()
+    contribution_variance = (alliance_scores.var(axis=0) - noise_variance) / alliance_size
+    # If the matches can't tell teams apart, contributions are shrunk most of the way to the average
+    contribution_variance = np.maximum(contribution_variance, 1e-3 * noise_variance + 1e-12)
+    return noise_variance / contribution_variance
+
+
+# Calculates every model in models from one eigendecomposition of the normal matrix. Alliance rows come in
+# (blue, red) pairs for each match, so every row's opponent is the other row of its pair.
+# Returns a dictionary of {model: solutions, ...} with the same layout as solve_normal_equations
+def calculate_models(decomposition, alliance_teams, alliance_scores, models=['opr', 'dpr', 'ccwm'],
+                     regularization=1.0, noise_ratio=None):
+    team_count = len(decomposition[0])
+    normal_vector = create_normal_vector(alliance_teams, team_count, alliance_scores)
+    opponent_scores = alliance_scores[np.arange(len(alliance_scores)) ^ 1]
+
+    solutions = {}
+    if any(model in models for model in ['opr', 'ccwm', 'mmse']):
+        solutions['opr'] = eigen_solve(decomposition, normal_vector)
+    if 'dpr' in models or 'ccwm' in models:
+        solutions['dpr'] = eigen_solve(decomposition, create_normal_vector(alliance_teams, team_count, opponent_scores))
+    if 'ccwm' in models:
+        solutions['ccwm'] = solutions['opr'] - solutions['dpr']
+    if 'ridge' in models:
+        solutions['ridge'] = eigen_solve(decomposition, normal_vector, regularization)
+    if 'mmse' in models:
+        if noise_ratio is None:
+            noise_ratio = estimate_noise_ratio(decomposition, alliance_teams, alliance_scores, solutions['opr'])
+        # Without any other information a team is expected to score an even share of the average alliance score
+        average_contribution = alliance_scores.mean(axis=0) / (alliance_teams >= 0).sum(axis=1).mean()
+        solutions['mmse'] = eigen_solve(decomposition, normal_vector, noise_ratio, average_contribution)
+
+    for model in models:
+        if model not in MODELS:
+            print(f"Make sure your models are from {', '.join(MODELS)}")
+    return {model: solutions[model] for model in models if model in solutions}
+
+
+# Solves M x = b for a symmetric positive definite M that is only available as a function apply(x) = M x, using the
+# conjugate gradient method with a Jacobi (diagonal) preconditioner. Starting from a guess close to the solution, ex.)
+# yesterday's, it only takes a few iterations. Stops once the residual is smaller than tolerance relative to b.
+# Returns (x, the number of iterations taken)
+def conjugate_gradient(apply, b, diagonal, initial=None, tolerance=1e-8, max_iterations=1000):
+    x = np.zeros_like(b) if initial is None else np.array(initial, dtype=float)
+    inverse_diagonal = np.where(diagonal > 0, 1 / np.where(diagonal > 0, diagonal, 1), 1)
+    residual = b - apply(x)
+    target = tolerance * np.linalg.norm(b)
+
+    preconditioned = inverse_diagonal * residual
+    direction = preconditioned.copy()
+    residual_product = residual @ preconditioned
+    for iteration in range(max_iterations):
+        if np.linalg.norm(residual) <= target:
+            return x, iteration
+        product = apply(direction)
+        step = residual_product / (direction @ product)
+        x += step * direction
+        residual -= step * product
+        preconditioned = inverse_diagonal * residual
+        next_residual_product = residual @ preconditioned
+        direction = preconditioned + (next_residual_product / residual_product) * direction
+        residual_product = next_residual_product
+    return x, max_iterations
+
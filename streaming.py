@@ -0,0 +1,296 @@
+import math
+from statistics import median
+from .utils import *
+from .instrumentation import timer
+
+"""
+Streaming field statistics that never hold more than one event's matches in memory.
+
+Matches are read event by event and flow through a chain of generators: they're filtered (playoffs, unplayed
+matches), each team's field value is extracted and the value is fed into a field_accumulator that keeps a constant
+amount of state per team no matter how many matches it has seen:
+- count, min and max are running values
+- mean and stdev use Welford's algorithm, which is numerically stable over long histories
+- med is estimated with the P² algorithm (Jain & Chlamtac), which tracks 5 markers instead of every value. It's exact
+up to 5 values and an estimate after that
+
+This lets season or multi-season statistics for every FRC team be calculated on a machine that couldn't hold all of
+the matches at once.
+
+Usage:
+for (year, statistics) in stream_field_trends('###MY_AUTHKEY###', range(2016, 2021), 'totalPoints', ['mean', 'max']):
+    print(year, statistics['mean']['frc2521'])
+"""
+
+
+# Running mean and standard deviation using Welford's algorithm
+class welford_accumulator:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the current mean
+        self.squared_deviations = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (value - self.mean)
+
+    # The sample standard deviation, like statistics.stdev. None until there are 2 values
+    def stdev(self):
+        return math.sqrt(self.squared_deviations / (self.count - 1)) if self.count > 1 else None
+
+
+# Streaming median estimate using the P² algorithm
+class p2_median:
+    def __init__(self):
+        # The first 5 values are kept to place the markers
+        self.initial_values = []
+        # Marker heights, their actual positions and their desired positions
+        self.heights = None
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 2, 3, 4, 5]
+        self.increments = [0, 0.25, 0.5, 0.75, 1]
+
+    def add(self, value):
+        if self.heights is None:
+            self.initial_values.append(value)
+            if len(self.initial_values) == 5:
+                self.heights = sorted(self.initial_values)
+            return
+
+        heights, positions = self.heights, self.positions
+        # Find the cell the value falls in, extending the outer markers if it's a new min or max
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = max(index for index in range(4) if heights[index] <= value)
+
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self.desired_positions[index] += self.increments[index]
+
+        # Move the middle markers towards their desired positions
+        for index in range(1, 4):
+            offset = self.desired_positions[index] - positions[index]
+            if (offset >= 1 and positions[index + 1] - positions[index] > 1) or \
+                    (offset <= -1 and positions[index - 1] - positions[index] < -1):
+                step = 1 if offset > 0 else -1
+                height = self.parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = heights[index] + step * (heights[index + step] - heights[index]) / (
+                            positions[index + step] - positions[index])
+                heights[index] = height
+                positions[index] += step
+
+    # Piecewise parabolic prediction of a marker's height after moving it by step
+    def parabolic(self, index, step):
+        heights, positions = self.heights, self.positions
+        return heights[index] + step / (positions[index + 1] - positions[index - 1]) * (
+                (positions[index] - positions[index - 1] + step) * (heights[index + 1] - heights[index]) /
+                (positions[index + 1] - positions[index]) +
+                (positions[index + 1] - positions[index] - step) * (heights[index] - heights[index - 1]) /
+                (positions[index] - positions[index - 1]))
+
+    def median(self):
+        if self.heights is None:
+            return median(self.initial_values) if len(self.initial_values) > 0 else None
+        return self.heights[2]
+
+
+"""
+Accumulates the values of one field for one team and calculates the requested statistics from them.
+
+Parameters:
+--------------------------------------------------------------
+calculations: list<string> = calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+
+Returns:
+result(): dictionary = Keys are the calculation names with values being the calculated value ex.) {mean: 77, max: 154}.
+Statistics that need more values than were added (ex. stdev of 1 value) are None
+---------------------------------------------------------------
+"""
+
+
+class field_accumulator:
+    def __init__(self, calculations=['mean']):
+        self.calculations = calculations
+        self.count = 0
+        self.min = None
+        self.max = None
+        # Only keep the state the calculations need
+        self.moments = welford_accumulator() if 'mean' in calculations or 'stdev' in calculations else None
+        self.median = p2_median() if 'med' in calculations else None
+
+    def add(self, value):
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.moments is not None:
+            self.moments.add(value)
+        if self.median is not None:
+            self.median.add(value)
+
+    def result(self):
+        calculated_statistics = {}
+        for calculation in self.calculations:
+            if calculation == 'mean':
+                calculated_statistics[calculation] = self.moments.mean if self.count > 0 else None
+            elif calculation == 'stdev':
+                calculated_statistics[calculation] = self.moments.stdev()
+            elif calculation == 'med':
+                calculated_statistics[calculation] = self.median.median()
+            elif calculation == 'min':
+                calculated_statistics[calculation] = self.min
+            elif calculation == 'max':
+                calculated_statistics[calculation] = self.max
+            elif calculation == 'count':
+                calculated_statistics[calculation] = self.count
+            else:
+                print("Make sure your calculation is either max, min, mean, med, count, or stdev")
+        return calculated_statistics
+
+
+# Yields a team's matches in a year, or at a single event if event_key is given. A team only plays about a hundred
+# matches in a year, so they're fetched with one request rather than one request per event
+def iter_team_matches(authkey, team_key, year, event_key=None):
+    tba = get_tba(authkey)
+    if event_key:
+        yield from tba.team_matches(team=team_key, event=event_key)
+    else:
+        yield from tba.team_matches(team=team_key, year=year)
+
+
+# Yields the matches of every event in a year, fetching one event at a time
+def iter_season_matches(authkey, year, event_keys=None):
+    tba = get_tba(authkey)
+    for event_key in (event_keys if event_keys is not None else tba.events(year, keys=True)):
+        yield from tba.event_matches(event=event_key)
+
+
+# Yields the played matches, leaving out playoff matches if exclude_playoffs is set
+def filter_matches(matches, exclude_playoffs=True):
+    for match in matches:
+        if match['score_breakdown'] is None or (exclude_playoffs and match['comp_level'] != 'qm'):
+            continue
+        yield match
+
+
+# Yields (team_key, value) for every team on every alliance of the matches. Position based fields yield whether
+# categorical_value was recorded for the team's station as 1 or 0. If team_keys is given, other teams are skipped
+def extract_field_values(matches, field_name, field_position_based=False, categorical_value=None, team_keys=None):
+    for match in matches:
+        for alliance_color in ['blue', 'red']:
+            breakdown = match['score_breakdown'][alliance_color]
+            for (station, team) in enumerate(match['alliances'][alliance_color]['team_keys']):
+                if team_keys is not None and team not in team_keys:
+                    continue
+                if field_position_based:
+                    yield team, int(breakdown[field_name + str(station + 1)] == categorical_value)
+                else:
+                    yield team, breakdown[field_name]
+
+
+# Feeds (team_key, value) pairs into one field_accumulator per team. Returns {team_key: field_accumulator, ...}
+def accumulate_team_values(team_values, calculations=['mean']):
+    accumulators = {}
+    for (team, value) in team_values:
+        accumulator = accumulators.get(team)
+        if accumulator is None:
+            accumulator = accumulators[team] = field_accumulator(calculations)
+        accumulator.add(value)
+    return accumulators
+
+
+# Turns accumulators into the results of get_event_field_statistics: {calculation: {team_key: value, ...}, ...}, or
+# {team_key: proportion, ...} for position based fields
+def collect_team_statistics(accumulators, calculations=['mean'], field_position_based=False):
+    with timer('aggregate'):
+        if field_position_based:
+            return {team: round(accumulator.moments.mean, 3) for (team, accumulator) in accumulators.items()}
+        team_statistics = {calculation: {} for calculation in calculations}
+        for (team, accumulator) in accumulators.items():
+            for (calculation, value) in accumulator.result().items():
+                team_statistics[calculation][team] = value
+        return team_statistics
+
+
+"""
+Streaming version of functions.get_field_statistic. The team's matches are fetched in one request and never kept.
+
+Parameters:
+team_key: string = the TBA key of a team
+year: int = the year the field is from
+field_name: string = the TBA field under scoring_breakdown to get calculations for
+calculations: list<string> = calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
+categorical_value: string = the categorical value to count. default=None
+exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+event_key: string = if specified, only include matches played at the given event in calculations. default=None
+"""
+
+
+def stream_field_statistic(authkey, team_key, year, field_name, calculations=['mean'], field_position_based=False,
+                           categorical_value=None, exclude_playoffs=True, event_key=None):
+    if field_position_based and categorical_value is None:
+        print("You must specify a categorical_value to count occurrences of. See docstring for more info")
+        return
+
+    matches = filter_matches(iter_team_matches(authkey, team_key, year, event_key), exclude_playoffs)
+    values = extract_field_values(matches, field_name, field_position_based, categorical_value, {team_key})
+    # Position based fields are the mean of 1s and 0s
+    calculations = ['mean'] if field_position_based else calculations
+    accumulator = accumulate_team_values(values, calculations).get(team_key, field_accumulator(calculations))
+
+    if field_position_based:
+        return round(accumulator.moments.mean, 3) if accumulator.count != 0 else None
+    return accumulator.result()
+
+
+"""
+Calculates statistics for a field for every team that played in a year, streaming the season event by event.
+
+Parameters:
+year: int = the year to calculate statistics for
+field_name: string = the TBA field under scoring_breakdown to get calculations for
+calculations: list<string> = calculations to perform. mean, med, min, max, stdev, count. default=['mean']
+field_position_based: boolean = whether the field is categorized in TBA based on robot_position. default=False
+categorical_value: string = the categorical value to count. default=None
+exclude_playoffs: boolean = whether to exclude playoff matches from calculations. default = True
+event_keys: list<string> = only stream these events instead of every event in the year. default=None
+team_keys: list<string> = only calculate statistics for these teams. default=None (every team)
+
+Returns:
+calculated_statistics: dictionary = the same layout as TBADataHelper.get_event_field_statistics()
+"""
+
+
+def stream_season_statistics(authkey, year, field_name, calculations=['mean'], field_position_based=False,
+                             categorical_value=None, exclude_playoffs=True, event_keys=None, team_keys=None):
+    if field_position_based and categorical_value is None:
+        print("You must specify a categorical_value to count occurrences of. See docstring for more info")
+        return
+
+    matches = filter_matches(iter_season_matches(authkey, year, event_keys), exclude_playoffs)
+    values = extract_field_values(matches, field_name, field_position_based, categorical_value,
+                                  set(team_keys) if team_keys is not None else None)
+    # Position based fields are the mean of 1s and 0s
+    accumulators = accumulate_team_values(values, ['mean'] if field_position_based else calculations)
+    return collect_team_statistics(accumulators, calculations, field_position_based)
+
+
+# Yields (year, calculated_statistics) for every year, where calculated_statistics is the result of
+# stream_season_statistics. Only one year's accumulators are held at a time
+def stream_field_trends(authkey, years, field_name, calculations=['mean'], field_position_based=False,
+                        categorical_value=None, exclude_playoffs=True, team_keys=None):
+    for year in years:
+        yield year, stream_season_statistics(authkey, year, field_name, calculations, field_position_based,
+                                             categorical_value, exclude_playoffs, team_keys=team_keys)
@@ -0,0 +1,45 @@
+import threading
+import pytest
+from ..bulk import deduplicated_TBA, bulk_field_statistics
+from ..fake_tba import install_fake_tba, generate_season
+from ..utils import get_tba, set_tba_factory
+
+
+@pytest.fixture
+def backend():
+    yield install_fake_tba(generate_season(2020, event_count=3, team_count=24), latency=0.05)
+    set_tba_factory(None)
+
+
+def test_requests_in_flight_are_sent_once_and_matches_are_released(backend):
+    tba = deduplicated_TBA(get_tba('fake'))
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(tba.event_matches(event='2020ev0')))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.request_count == 1 and tba.deduplicated_count == 9
+    assert all(response is responses[0] for response in responses)
+    assert tba.responses == {}
+
+    # Event lists are kept for the rest of the year
+    tba.events(2020, keys=True)
+    tba.events(2020, keys=True)
+    assert backend.request_count == 2
+    assert list(tba.responses) == [('events', (2020,), (('keys', True),))]
+
+
+def test_bulk_field_statistics(backend):
+    rows = bulk_field_statistics('fake', ['frc1', 'frc2'], [2020], ['totalPoints'], ['mean', 'count'])
+    assert {row['team_key'] for row in rows} <= {'frc1', 'frc2'}
+    assert all(row['value'] is not None for row in rows)
+
+
+# Position based fields that aren't in the score breakdown are skipped like unknown numeric fields
+def test_bulk_missing_position_based_field(backend):
+    rows = bulk_field_statistics('fake', ['frc1'], [2020], [('endgameRobot', 'Hang'), ('climbRobot', 'Hang')],
+                                 ['mean'])
+    assert rows and {row['field'] for row in rows} == {'endgameRobot'}
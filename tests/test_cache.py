@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from ..async_tba import async_TBA
+from ..cache import response_cache, cached_TBA
+from ..instrumentation import collect_stats
+
+YEAR = date.today().year
+EVENT_KEY = '%sfake' % YEAR
+LIVE_TTL = 300
+FINISHED_TTL = 30 * 24 * 60 * 60
+
+
+def create_match(comp_level, match_number, played=True):
+    score = 50 + match_number if played else -1
+    return {'key': '%s_%s%s' % (EVENT_KEY, comp_level, match_number), 'comp_level': comp_level,
+            'match_number': match_number, 'alliances': {'blue': {'team_keys': ['frc1', 'frc2', 'frc3'], 'score': score},
+                                                        'red': {'team_keys': ['frc4', 'frc5', 'frc6'], 'score': score}},
+            'score_breakdown': {} if played else None}
+
+
+# Fake TBA answering with ETags, and 304 Not Modified when the client already has the current version
+class fake_tba_handler(BaseHTTPRequestHandler):
+    # Keys are request paths after /api/v3/. Values are the JSON data sent back
+    responses = {}
+    requests = []
+    # Request paths always answered with 429 Too Many Requests
+    rate_limited = set()
+
+    def do_GET(self):
+        url = self.path.split('/api/v3/', 1)[1]
+        self.requests.append((url, self.headers.get('If-None-Match')))
+        if url in self.rate_limited:
+            body = b'Too Many Requests'
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url not in self.responses:
+            return self.send_body(404, {'Errors': [{'url': 'Not found'}]})
+        body = json.dumps(self.responses[url]).encode()
+        etag = '"%s"' % hash(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_body(200, self.responses[url], etag)
+
+    def send_body(self, status, data, etag=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    handler = type('handler', (fake_tba_handler,), {'responses': {}, 'requests': [], 'rate_limited': set()})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, 'http://%s:%d/api/v3/' % server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache():
+    cache = response_cache(':memory:', live_ttl=LIVE_TTL, finished_ttl=FINISHED_TTL)
+    yield cache
+    cache.close()
+
+
+# Returns the number of seconds the cache keeps a url fresh for
+def get_stored_ttl(cache, url):
+    expires, last_access = cache.connection.execute(
+        "SELECT expires, last_access FROM responses WHERE url = ?", (url,)).fetchone()
+    return round(expires - last_access)
+
+
+def test_fresh_responses_are_served_from_the_cache(server, cache):
+    handler, read_url = server
+    handler.responses['event/%s/matches' % EVENT_KEY] = [create_match('qm', 1)]
+    tba = cached_TBA('fake', cache, read_url)
+
+    with collect_stats() as stats:
+        first = tba.event_matches(EVENT_KEY)
+        second = cached_TBA('fake', cache, read_url).event_matches(EVENT_KEY)
+    assert [dict(match) for match in first] == [dict(match) for match in second]
+    assert len(handler.requests) == 1
+    assert stats.summary()[None]['cache_hits'] == 1
+
+
+def test_stale_responses_are_revalidated(server, cache):
+    handler, read_url = server
+    url = 'event/%s/matches' % EVENT_KEY
+    handler.responses[url] = [create_match('qm', 1)]
+    tba = cached_TBA('fake', cache, read_url)
+    tba.event_matches(EVENT_KEY)
+
+    # Unchanged data only costs a 304
+    cache.connection.execute("UPDATE responses SET expires = 0")
+    with collect_stats() as stats:
+        matches = tba.event_matches(EVENT_KEY)
+    assert handler.requests[-1][1] is not None
+    assert stats.summary()[None]['cache_revalidations'] == 1
+    assert matches[0]['key'] == '%s_qm1' % EVENT_KEY
+    assert cache.get(url)['fresh']
+
+    # Changed data is sent again and stored
+    cache.connection.execute("UPDATE responses SET expires = 0")
+    handler.responses[url] = [create_match('qm', 1), create_match('qm', 2)]
+    assert len(tba.event_matches(EVENT_KEY)) == 2
+    assert len(cache.get(url)['data']) == 2
+
+
+def test_handlers_have_their_own_sessions(cache):
+    assert cached_TBA('fake', cache).cache_session is not cached_TBA('fake', cache).cache_session
+
+
+@pytest.mark.parametrize('matches, ttl', [
+    ([create_match('qm', 1), create_match('qm', 2, played=False)], LIVE_TTL),
+    # Every qualification match has been played, but the playoffs haven't started
+    ([create_match('qm', 1), create_match('qm', 2)], LIVE_TTL),
+    ([create_match('qm', 1), create_match('qm', 2), create_match('sf', 1), create_match('f', 1)], FINISHED_TTL),
+])
+def test_event_matches_ttl(cache, matches, ttl):
+    url = 'event/%s/matches' % EVENT_KEY
+    cache.put(url, matches)
+    assert get_stored_ttl(cache, url) == ttl
+
+
+@pytest.mark.parametrize('end_date, ttl', [(date.today() - timedelta(days=2), FINISHED_TTL),
+                                           (date.today() + timedelta(days=2), LIVE_TTL)])
+def test_event_end_date_ttl(cache, end_date, ttl):
+    # The end date is remembered from the events list
+    cache.put('events/%s' % YEAR, [{'key': EVENT_KEY, 'end_date': end_date.isoformat()}])
+    url = 'event/%s/matches' % EVENT_KEY
+    cache.put(url, [create_match('qm', 1, played=False)])
+    assert get_stored_ttl(cache, url) == ttl
+    cache.put('event/%s/teams/keys' % EVENT_KEY, ['frc1'])
+    assert get_stored_ttl(cache, 'event/%s/teams/keys' % EVENT_KEY) == ttl
+
+
+def test_past_seasons_ttl(cache):
+    cache.put('team/frc1/matches/%s' % (YEAR - 1), [])
+    cache.put('team/frc1/matches/%s' % YEAR, [create_match('qm', 1), create_match('f', 1)])
+    assert get_stored_ttl(cache, 'team/frc1/matches/%s' % (YEAR - 1)) == FINISHED_TTL
+    # A team's matches in the current season aren't finished even if every match so far has been played
+    assert get_stored_ttl(cache, 'team/frc1/matches/%s' % YEAR) == LIVE_TTL
+
+
+def test_least_recently_used_responses_are_evicted(cache):
+    for number in range(3):
+        cache.put('event/%sev%s/matches' % (YEAR, number), [create_match('qm', 1)])
+        time.sleep(0.01)
+    # Room for exactly the three responses stored
+    cache.max_size = cache.connection.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    cache.get('event/%sev0/matches' % YEAR)
+    cache.put('event/%sev3/matches' % YEAR, [create_match('qm', 1)])
+
+    assert cache.get('event/%sev1/matches' % YEAR) is None
+    assert cache.get('event/%sev0/matches' % YEAR) is not None
+    assert cache.get('event/%sev3/matches' % YEAR) is not None
+
+
+def test_async_requests_rate_limited_after_every_retry(server):
+    from tbapy.exceptions import TBAErrorList
+    handler, read_url = server
+    handler.rate_limited.add('event/%s/matches' % EVENT_KEY)
+
+    async def request():
+        tba = async_TBA('fake', max_retries=2, read_url=read_url)
+        try:
+            return await tba.event_matches(EVENT_KEY)
+        finally:
+            await tba.close()
+
+    with pytest.raises(TBAErrorList, match='rate_limit'):
+        asyncio.run(request())
+    assert len(handler.requests) == 3
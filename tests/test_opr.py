@@ -0,0 +1,39 @@
+import pytest
+from ..fake_tba import install_fake_tba, generate_event
+from ..TBADataHelper import TBADataHelper
+from ..utils import set_tba_factory
+
+TEAM_KEYS = ['frc%s' % number for number in range(1, 25)]
+
+
+@pytest.fixture
+def unplayed_event():
+    install_fake_tba({'2020ev0': generate_event('2020ev0', TEAM_KEYS, played_count=0, playoff_count=0)})
+    yield TBADataHelper('fake', 2020)
+    set_tba_factory(None)
+
+
+# Before an event starts there are no score breakdowns to take the numeric fields from
+def test_all_fields_before_any_match_is_played(unplayed_event):
+    assert unplayed_event.get_event_component_OPRs('2020ev0', 'all') == {}
+    assert unplayed_event.get_event_contributions('2020ev0', field='all') == {'opr': {}, 'dpr': {}, 'ccwm': {}}
+    assert unplayed_event.get_event_OPRs('2020ev0') == {}
+
+
+# Played qualification matches of a generated event: every match, a third of the event (where every team is
+# determined) and the first few matches (where most teams aren't)
+@pytest.mark.parametrize('played_count, tolerance', [(None, 1e-9), (20, 1e-9), (3, 1e-5)])
+def test_live_OPR_matches_event_OPR(played_count, tolerance):
+    from ..live_opr import live_event_OPR
+    from ..opr import event_OPR
+
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, played_count=played_count)
+    expected = event_OPR('fake', '2020ev0', 'totalPoints', matches=matches).calculate_contribution(solver='lstsq')
+    live = live_event_OPR('fake', '2020ev0', 'totalPoints', matches=[])
+    # Ingest the matches a few at a time like refresh() does during an event
+    for start in range(0, len(matches), 7):
+        live.add_matches(matches[start:start + 7])
+    calculated = live.calculate_contribution()
+
+    assert set(calculated) == set(expected)
+    assert max(abs(calculated[team] - expected[team]) for team in expected) < tolerance
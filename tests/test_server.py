@@ -0,0 +1,178 @@
+import copy
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from ..fake_tba import install_fake_tba, generate_season
+from ..server import create_server, memory_cache, parse_parameters
+from ..utils import set_tba_factory
+
+
+# Replaces one of an event's matches with a copy whose blue score is changed, like TBA correcting a score. The fake
+# backend's matches share their dictionaries with the ones the server has cached, so they're copied before changing
+def change_score(data, event_key, points=100):
+    match = copy.deepcopy(data[event_key][0])
+    match['score_breakdown']['blue']['totalPoints'] += points
+    data[event_key][0] = match
+
+
+@pytest.fixture
+def season():
+    data = generate_season(2020, event_count=2, team_count=24)
+    backend = install_fake_tba(data, latency=0.02)
+    yield data, backend
+    set_tba_factory(None)
+
+
+# Starts a server on a free port and returns a function making requests to it
+@pytest.fixture
+def serve(season):
+    servers = []
+
+    def start(**arguments):
+        server = create_server('fake', 2020, port=0, **arguments)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        base = 'http://%s:%d' % server.server_address
+
+        def request(path, body=None):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(base + path, data=body,
+                                                                   method='POST' if body is not None else 'GET')) as response:
+                    return response.status, json.loads(response.read())
+            except urllib.error.HTTPError as error:
+                return error.code, json.loads(error.read())
+
+        return server, request
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_identical_requests_are_coalesced(season, serve):
+    _, backend = season
+    server, request = serve(refresh_interval=3600)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(request('/get_event_OPRs?event_key=2020ev0')))
+               for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.request_count == 1
+    assert all(result == results[0] for result in results)
+    assert results[0][0] == 200
+    stats = server.service.cache.stats()
+    assert stats['hits'] + stats['coalesced'] > 0
+    assert stats['misses'] == 3
+
+
+def test_single_list_parameter(serve):
+    _, request = serve()
+    status, result = request('/get_event_field_statistics?event_key=2020ev0&field_name=totalPoints&calculations=max')
+    assert status == 200
+    assert list(result) == ['max'] and len(result['max']) == 24
+    assert parse_parameters('models=opr&fields=all&fields_position_based=true') == \
+        {'models': ['opr'], 'fields': 'all', 'fields_position_based': True}
+
+
+def test_least_recently_used_values_are_evicted_by_size():
+    cache = memory_cache(max_size=2000)
+    for key in range(3):
+        cache.get_or_create(key, lambda: list(range(50)), 'event')
+    # Using 0 makes 1 the least recently used
+    cache.get_or_create(0, lambda: None, 'event')
+    cache.get_or_create(3, lambda: list(range(50)), 'event')
+
+    assert cache.size <= cache.max_size
+    assert cache.evictions > 0
+    assert 0 in cache.entries and 3 in cache.entries and 1 not in cache.entries
+    # Values bigger than the whole cache aren't stored
+    cache.get_or_create('large', lambda: list(range(1000)), 'event')
+    assert 'large' not in cache.entries
+
+
+def test_refresh_interval(season, serve):
+    data, backend = season
+    server, request = serve(refresh_interval=3600)
+    path = '/get_event_OPRs?event_key=2020ev0'
+    first = request(path)[1]
+    change_score(data, '2020ev0')
+    # The matches aren't checked again until the refresh interval passes
+    assert request(path)[1] == first
+    assert backend.request_count == 1
+
+    server.service.refresh_interval = 0
+    assert request(path)[1] != first
+    assert backend.request_count == 2
+
+    # A detected change doesn't make the next request check the matches again
+    assert '2020ev0' in server.service.checked_times
+    server.service.refresh_interval = 3600
+    request(path)
+    assert backend.request_count == 2
+
+
+@pytest.mark.parametrize('body', [None, {'message_type': 'match_score',
+                                         'message_data': {'event_name': 'Event 0', 'match': {'event_key': '2020ev0'}}}])
+def test_invalidate(season, serve, body):
+    data, backend = season
+    _, request = serve(refresh_interval=3600)
+    path = '/get_event_OPRs?event_key=2020ev0'
+    first = request(path)[1]
+    request('/get_event_OPRs?event_key=2020ev1')
+    change_score(data, '2020ev0')
+
+    if body is None:
+        status, result = request('/invalidate?event_key=2020ev0', b'')
+    else:
+        status, result = request('/invalidate', json.dumps(body).encode())
+    assert status == 200
+    assert result['event_key'] == '2020ev0' and result['invalidated'] > 0
+    assert request(path)[1] != first
+    # The other event is still cached
+    count = backend.request_count
+    request('/get_event_OPRs?event_key=2020ev1')
+    assert backend.request_count == count
+
+
+# An event invalidated after a request read its matches, but before its result was stored, mustn't keep the result
+# calculated from the old matches
+def test_invalidate_during_calculation(season, serve):
+    data, _ = season
+    server, request = serve(refresh_interval=3600)
+    service = server.service
+    path = '/get_event_OPRs?event_key=2020ev0'
+    matches_read = threading.Event()
+    resume = threading.Event()
+    get_matches = service.get_matches
+
+    def paused_get_matches(event_key):
+        result = get_matches(event_key)
+        if not resume.is_set():
+            matches_read.set()
+            resume.wait(5)
+        return result
+
+    service.get_matches = paused_get_matches
+    results = []
+    thread = threading.Thread(target=lambda: results.append(request(path)))
+    thread.start()
+    assert matches_read.wait(5)
+
+    change_score(data, '2020ev0')
+    service.invalidate('2020ev0')
+    resume.set()
+    thread.join()
+
+    expected = create_server('fake', 2020, port=0)
+    try:
+        assert request(path)[1] == json.loads(json.dumps(expected.service.call('get_event_OPRs',
+                                                                               {'event_key': '2020ev0'})))
+    finally:
+        expected.server_close()
+    assert request(path)[1] != results[0][1]
@@ -0,0 +1,127 @@
+import math
+import numpy as np
+import pytest
+from ..fake_tba import install_fake_tba, generate_event
+from ..utils import set_tba_factory
+
+TEAM_KEYS = ['frc%s' % number for number in range(1, 25)]
+# Played qualification matches of a generated event: every match, a third of the event (where every team is
+# determined) and the first few matches (where most teams aren't)
+PLAYED_COUNTS = [None, 20, 3]
+
+
+# Returns (team_keys, A, b): the dense alliances matrix of the played qualification matches with a blue then a red row
+# for every match, and the alliances' scores. np.linalg.lstsq on it is what every solver is checked against
+def create_reference_system(matches, metric='totalPoints'):
+    played = [match for match in matches if match['comp_level'] == 'qm' and match['score_breakdown'] is not None]
+    team_keys = sorted({team for match in played for alliance in match['alliances'].values()
+                        for team in alliance['team_keys']})
+    team_indices = {team: index for (index, team) in enumerate(team_keys)}
+    alliances_matrix = np.zeros((len(played) * 2, len(team_keys)))
+    scores = np.zeros(len(played) * 2)
+    for (match_index, match) in enumerate(played):
+        for (alliance_index, alliance_color) in enumerate(['blue', 'red']):
+            row = match_index * 2 + alliance_index
+            for team in match['alliances'][alliance_color]['team_keys']:
+                alliances_matrix[row, team_indices[team]] = 1
+            scores[row] = match['score_breakdown'][alliance_color][metric]
+    return team_keys, alliances_matrix, scores
+
+
+def lstsq(alliances_matrix, scores):
+    return np.linalg.lstsq(alliances_matrix, scores, rcond=None)[0]
+
+
+# Returns the largest difference between a dictionary of team CCs and an array of the reference CCs
+def max_difference(calculated, team_keys, expected):
+    assert set(calculated) == set(team_keys)
+    return max(abs(calculated[team] - expected[index]) for (index, team) in enumerate(team_keys))
+
+
+@pytest.fixture
+def event():
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, playoff_count=0)
+    install_fake_tba({'2020ev0': matches})
+    yield matches
+    set_tba_factory(None)
+
+
+@pytest.mark.parametrize('played_count', PLAYED_COUNTS)
+@pytest.mark.parametrize('solver', ['cholesky', 'lstsq'])
+def test_event_OPR(solver, played_count):
+    from ..opr import event_OPR
+
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, played_count=played_count, playoff_count=0)
+    team_keys, alliances_matrix, scores = create_reference_system(matches)
+    calculated = event_OPR('fake', '2020ev0', 'totalPoints', matches=matches).calculate_contribution(solver)
+    assert max_difference(calculated, team_keys, lstsq(alliances_matrix, scores)) < 1e-8
+
+
+# OPR, DPR and CCWM are least squares fits to the alliance's own score, the opponent's score and the margin. Ridge
+# is the least squares fit with sqrt(regularization) * I appended to the alliances matrix and zeros to the scores
+@pytest.mark.parametrize('played_count', PLAYED_COUNTS)
+def test_event_models(played_count):
+    from ..opr import event_OPR
+
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, played_count=played_count, playoff_count=0)
+    team_keys, alliances_matrix, scores = create_reference_system(matches)
+    opponent_scores = scores.reshape(-1, 2)[:, ::-1].reshape(-1)
+    regularization = 2.0
+    expected = {'opr': lstsq(alliances_matrix, scores), 'dpr': lstsq(alliances_matrix, opponent_scores),
+                'ccwm': lstsq(alliances_matrix, scores - opponent_scores),
+                'ridge': lstsq(np.r_[alliances_matrix, math.sqrt(regularization) * np.eye(len(team_keys))],
+                               np.r_[scores, np.zeros(len(team_keys))])}
+
+    calculated = event_OPR('fake', '2020ev0', 'totalPoints', matches=matches).calculate_models(list(expected),
+                                                                                           regularization)
+    for (model, solutions) in expected.items():
+        contributions = {team: CCs['totalPoints'] for (team, CCs) in calculated[model].items()}
+        assert max_difference(contributions, team_keys, solutions) < 1e-8, model
+
+
+# With a single event and no offsets the season system is the event's system, and a negligible regularization leaves
+# the least squares solution
+def test_world_OPR(event):
+    from ..match_table import load_match_table
+    from ..world_opr import world_OPR
+
+    team_keys, alliances_matrix, scores = create_reference_system(event)
+    table = load_match_table('fake', event_keys=['2020ev0'])
+    calculated = world_OPR(table, regularization=1e-10).calculate_contribution(tolerance=1e-13)
+    assert max_difference(calculated, team_keys, lstsq(alliances_matrix, scores)) < 1e-6
+
+
+# Expected scores are the sums of the alliance's least squares CCs, and blue's win probability is the normal CDF of the
+# expected margin over its standard deviation sqrt(2 * residual variance)
+def test_event_predictions():
+    from ..simulation import event_simulation
+
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, played_count=40, playoff_count=0)
+    team_keys, alliances_matrix, scores = create_reference_system(matches)
+    solutions = lstsq(alliances_matrix, scores)
+    residual_variance = ((scores - alliances_matrix @ solutions) ** 2).sum() / \
+        (len(scores) - np.linalg.matrix_rank(alliances_matrix))
+    contributions = dict(zip(team_keys, solutions))
+
+    predictions = event_simulation('fake', '2020ev0', matches=matches).predict_matches()
+    assert len(predictions) == 60
+    for match in matches:
+        expected = {alliance_color: sum(contributions[team] for team in match['alliances'][alliance_color]['team_keys'])
+                    for alliance_color in ['blue', 'red']}
+        margin = (expected['blue'] - expected['red']) / math.sqrt(2 * residual_variance)
+        prediction = predictions[match['key']]
+        assert abs(prediction['blue'] - expected['blue']) < 1e-8 and abs(prediction['red'] - expected['red']) < 1e-8
+        # normal_cdf approximates erf to within 1.5e-7
+        assert abs(prediction['blue_win_probability'] - 0.5 * math.erfc(-margin / math.sqrt(2))) < 1e-6
+
+
+# Each batch has its own seed, so the forecast doesn't depend on whether the batches run in (spawned) worker processes
+def test_ranking_forecast_workers():
+    from ..simulation import event_simulation
+
+    matches = generate_event('2020ev0', TEAM_KEYS, match_count=60, played_count=40, playoff_count=0)
+    simulation = event_simulation('fake', '2020ev0', matches=matches)
+    serial = simulation.simulate_rankings(simulations=400, seed=1, batch_size=100)
+    parallel = simulation.simulate_rankings(simulations=400, seed=1, workers=2, batch_size=100)
+    assert serial == parallel
+    assert all(abs(sum(forecast['rank_probabilities']) - 1) < 1e-9 for forecast in serial.values())
@@ -0,0 +1,11 @@
+from tbapy import TBA
+from .instrumentation import record, timer
+
+
+# tbapy data handler that counts requests and records the time spent on them (see instrumentation.py). tbapy decodes
+# the response inside _get, so the decoding is part of the fetch time
+class timed_TBA(TBA):
+    def _get(self, url):
+        record('requests')
+        with timer('fetch'):
+            return super()._get(url)
@@ -1,4 +1,24 @@
-from tbapy import TBA
+# Creates the default TBA data handler (see timed_tba.py). tbapy and the requests stack under it are only imported once
+# the first handler is created
+def create_timed_tba(authkey):
+    from .timed_tba import timed_TBA
+    return timed_TBA(authkey)
+
+
+# Creates the TBA data handler used by every request in the package. Replaced through set_tba_factory() to put a
+# response cache or a different backend underneath all of the calculations
+tba_factory = create_timed_tba
+
+
+# Given an auth key, return a TBA data handler built by the current factory
+def get_tba(authkey):
+    return tba_factory(authkey)
+
+
+# Replace the factory used to create TBA data handlers. Passing None restores the default tbapy client
+def set_tba_factory(factory):
+    global tba_factory
+    tba_factory = factory if factory is not None else create_timed_tba
 
 
 # Given a match and a team, return which alliance a team was on
@@ -13,8 +33,11 @@ def get_alliance_color(match, team_key):
 
 # Given a match and a team, return which number the robot was classified under in TBA
 def get_robot_number(match, team_key):
-    return match["alliances"][get_alliance_color(match, team_key)]["team_keys"].index(
-        team_key) + 1
+    for alliance_color in ["blue", "red"]:
+        team_keys = match["alliances"][alliance_color]["team_keys"]
+        if team_key in team_keys:
+            return team_keys.index(team_key) + 1
+    raise KeyError(team_key)
 
 
 # Return whether a match existed
@@ -28,7 +51,7 @@ def check_match_exists(match):
 
 # Return True if matches exist for a certain event or team
 def check_matches_exist(authkey, year, team_key=None, event_key=None, exclude_playoffs=False):
-    tba = TBA(authkey)
+    tba = get_tba(authkey)
     if event_key is not None and team_key is None:
         if exclude_playoffs and len(get_qualification_matches(tba.event_matches(event=event_key))) == 0:
             return False
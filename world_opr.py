@@ -0,0 +1,153 @@
+import numpy as np
+from .solvers import conjugate_gradient
+from .instrumentation import record, timer
+
+"""
+This class calculates one contribution (CC) per team for a whole season by solving every match of every event as a
+single system, so teams that never met are still compared through the teams they both played with.
+
+Every alliance in every match is a row of the system, built straight from the columns of a MatchTable without looping
+over matches. The (teams x teams) normal matrix is never formed: A^T W A x is applied by gathering each row's teams
+and scattering the rows back onto teams with np.bincount, and the system is solved with preconditioned conjugate
+gradient. Passing the previous solution as the starting point means a nightly update only takes a few iterations.
+
+- event_offsets adds one unknown per event that's added to every alliance score at the event, so events that score
+higher or lower overall (ex. field or referee differences) don't inflate or deflate their teams. The offsets are kept
+centered on 0 so the season's overall scoring level stays in the team contributions
+- half_life weights each match by how recently it was played, halving the weight every half_life days
+- regularization is a small ridge term that keeps teams and events the matches don't separate from each other (ex.
+two teams that only ever played together) from having arbitrary contributions
+
+Parameters:
+--------------------------------------------------------------
+table: MatchTable = the season's matches (see match_table.py)
+metric: string = the numeric score_breakdown field to calculate contribution for. Default = 'totalPoints'
+exclude_playoffs: boolean = whether to include playoff matches in CC calculations. Default = True
+event_offsets: boolean = whether to solve for a score offset per event. Default = False
+half_life: float = the number of days it takes for a match's weight to halve. Default = None (every match counts equally)
+regularization: float = how strongly contributions and offsets are shrunk towards 0. Default = 1e-3
+
+calculate_contribution() parameters:
+initial: dictionary {team_key: CC, ...} = contributions to start from, ex.) the previous night's. Default = None
+initial_offsets: dictionary {event_key: offset, ...} = event offsets to start from. Default = None
+tolerance: float = the residual of the normal equations to stop at, relative to A^T W b. Default = 1e-8
+max_iterations: int = the most conjugate gradient iterations to run. Default = 1000
+
+Returns:
+calculated_contribution: dictionary {team_key: CC, ...} = A dictionary with keys being TBA team_keys and values being
+the team's CC over the season
+
+get_event_offsets() returns:
+event_offsets: dictionary {event_key: offset, ...} = each event's offset from the last solve. Empty without event_offsets
+---------------------------------------------------------------
+"""
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class world_OPR:
+    def __init__(self, table, metric='totalPoints', exclude_playoffs=True, event_offsets=False, half_life=None,
+                 regularization=1e-3):
+        self.table = table
+        self.metric = metric
+        self.event_offsets = event_offsets
+        self.regularization = regularization
+
+        with timer('matrix'):
+            self.create_system(exclude_playoffs, half_life)
+
+        # The last solution, with the team contributions first and the event offsets after them
+        self.solution = None
+        self.iterations = 0
+
+    # Turns the played matches into flat arrays with one entry per alliance row or per team on a row
+    def create_system(self, exclude_playoffs, half_life):
+        table = self.table
+        rows = np.flatnonzero(table.mask(exclude_playoffs=exclude_playoffs, played_only=True))
+        scores = table.numeric_fields[self.metric][rows].reshape(-1) if self.metric in table.numeric_fields else \
+            np.full(len(rows) * 2, np.nan)
+        alliance_teams = table.alliance_teams[rows].reshape(len(rows) * 2, -1)
+        alliance_events = np.repeat(table.match_events[rows], 2)
+        alliance_times = np.repeat(table.times[rows], 2)
+
+        # Alliances without a value for the metric aren't part of the system
+        valid = ~np.isnan(scores)
+        self.scores = scores[valid]
+        alliance_teams = alliance_teams[valid]
+        alliance_events = alliance_events[valid]
+        alliance_times = alliance_times[valid]
+
+        # Every (alliance row, team) pair. Team and event ids are renumbered so only those in the system get unknowns
+        entry_rows, entry_stations = np.nonzero(alliance_teams >= 0)
+        team_ids, self.entry_teams = np.unique(alliance_teams[entry_rows, entry_stations], return_inverse=True)
+        event_ids, self.row_events = np.unique(alliance_events, return_inverse=True)
+        self.entry_rows = entry_rows
+        self.team_keys = [table.team_keys[team] for team in team_ids]
+        self.event_keys = [table.event_keys[event] for event in event_ids]
+        self.team_count = len(self.team_keys)
+        self.event_count = len(self.event_keys) if self.event_offsets else 0
+
+        # Matches without a time count as recent as the latest match
+        self.weights = np.ones(len(self.scores))
+        if half_life is not None and len(self.scores) > 0:
+            latest = np.nanmax(alliance_times) if not np.isnan(alliance_times).all() else 0
+            ages = (latest - np.nan_to_num(alliance_times, nan=latest)) / SECONDS_PER_DAY
+            self.weights = 0.5 ** (ages / half_life)
+
+    # Returns A x: the score predicted for every alliance row by adding up its teams' contributions and its event offset
+    def predict(self, solution):
+        predictions = np.bincount(self.entry_rows, weights=solution[self.entry_teams], minlength=len(self.scores))
+        if self.event_offsets:
+            offsets = solution[self.team_count:]
+            predictions += (offsets - offsets.mean())[self.row_events]
+        return predictions
+
+    # Returns A^T y: every alliance row's value summed onto its teams and its event
+    def scatter(self, row_values, centered=True):
+        team_values = np.bincount(self.entry_teams, weights=row_values[self.entry_rows], minlength=self.team_count)
+        if not self.event_offsets:
+            return team_values
+        event_values = np.bincount(self.row_events, weights=row_values, minlength=self.event_count)
+        return np.r_[team_values, event_values - event_values.mean() if centered else event_values]
+
+    # Returns (A^T W A + regularization * I) x without forming A^T W A
+    def apply_normal_matrix(self, solution):
+        return self.scatter(self.weights * self.predict(solution)) + self.regularization * solution
+
+    # Returns the diagonal of A^T W A + regularization * I: the total weight of the rows every team and event is on
+    def create_normal_diagonal(self):
+        return self.scatter(self.weights, centered=False) + self.regularization
+
+    # Returns the starting point of the solve, filling in teams and events that aren't in the initial values
+    def create_initial_solution(self, initial=None, initial_offsets=None):
+        if initial is None and initial_offsets is None:
+            return self.solution if self.solution is not None and len(self.solution) == \
+                self.team_count + self.event_count else None
+
+        # Without any other information a team is expected to score an even share of the average alliance score
+        team_sizes = np.bincount(self.entry_rows, minlength=len(self.scores))
+        average_contribution = self.scores.mean() / team_sizes.mean() if len(self.scores) > 0 else 0.0
+        initial, initial_offsets = initial or {}, initial_offsets or {}
+        team_values = [initial.get(team, average_contribution) for team in self.team_keys]
+        event_values = [initial_offsets.get(event, 0.0) for event in self.event_keys] if self.event_offsets else []
+        return np.array(team_values + event_values, dtype=float)
+
+    # This function solves the normal equations and returns a dictionary of team_keys and their CCs
+    def calculate_contribution(self, initial=None, initial_offsets=None, tolerance=1e-8, max_iterations=1000):
+        with timer('matrix'):
+            normal_vector = self.scatter(self.weights * self.scores)
+            diagonal = self.create_normal_diagonal()
+        with timer('solve'):
+            self.solution, self.iterations = conjugate_gradient(
+                self.apply_normal_matrix, normal_vector, diagonal, self.create_initial_solution(initial, initial_offsets),
+                tolerance, max_iterations)
+        record('solver_iterations', count=self.iterations)
+
+        return dict(zip(self.team_keys, self.solution[:self.team_count].tolist()))
+
+    # Returns each event's offset from the last solve
+    def get_event_offsets(self):
+        if self.solution is None or not self.event_offsets:
+            return {}
+        offsets = self.solution[self.team_count:]
+        return dict(zip(self.event_keys, (offsets - offsets.mean()).tolist()))